@@ -7,11 +7,15 @@
 
 '''
 
+import os
 import praw
 from time import sleep
-import requests
-from collections import deque
 import cPickle as pickle
+from profiler import profile
+from metadata_cache import MetadataCache
+from seen_store import SeenStore
+from post_queue import PostQueue
+from enrichment import Enricher
 
 
 USER_AGENT="audioBookGuide v1.0"
@@ -20,27 +24,84 @@ TARGET_SUB="audiobooksonyoutube"
 #GOODREADS_KEY=YOUR GOODREADS API KEY
 #YOUTUBE_KEY=YOUR YOUTUBE API KEY
 
-
-'''	Parse the newest submissions in the target sub. Return a list of
+# Lookup parameters. At most MAX_LOOKUPS requests are made at once, and each
+# one is given up on after REQUEST_TIMEOUT seconds.
+MAX_LOOKUPS=8
+REQUEST_TIMEOUT=10
+
+# Youtube parameters. The API looks up at most YOUTUBE_BATCH videos (or
+# playlist items) per request.
+YOUTUBE_BATCH=50
+MAX_PLAYLIST_PAGES=10
+
+# Metadata cache parameters. Lookups are cached for METADATA_TTL seconds, and
+# titles (or videos) that weren't found for NEGATIVE_TTL seconds.
+METADATA_FNAME='abg-metadata.db'
+METADATA_TTL=30 * 24 * 60 * 60
+NEGATIVE_TTL=24 * 60 * 60
+METADATA_SIZE=5000
+
+# A title resolves to a book we've already found if their similarity (between
+# 0 and 1) is at least TITLE_SIMILARITY.
+TITLE_SIMILARITY=0.8
+
+# Polling parameters. We poll every MIN_POLL_INTERVAL seconds while there are
+# new posts, backing off to MAX_POLL_INTERVAL when it's quiet. Each poll pages
+# back through at most MAX_BACKFILL posts to catch up.
+MIN_POLL_INTERVAL=60
+MAX_POLL_INTERVAL=2400
+MAX_BACKFILL=1000
+FIRST_RUN_LIMIT=10
+
+# Posting parameters. A comment that fails to post is retried after
+# POST_BACKOFF seconds, doubling each time (up to MAX_POST_BACKOFF), and given
+# up on after MAX_POST_ATTEMPTS tries.
+MAX_POST_ATTEMPTS=6
+POST_BACKOFF=120
+MAX_POST_BACKOFF=3600
+DEAD_LETTER_FNAME='abg-dead-letter.log'
+
+# The startup and per-call profile is rewritten to PROFILE_FNAME each cycle.
+PROFILE_FNAME='abg-profile.txt'
+
+
+'''	Parse the submissions in the target sub that are newer than the
+	'high_water' mark, paging back as far as we need to. Return a list of
 	dictionaries, where each dict contains the actual submission object,
-	submission metadata, and the Youtube ID of the link audio. '''
-def parse_submissions(target_sub):
+	submission metadata, and the Youtube ID of the link audio, along with the
+	new high water mark. Without a mark, only the newest few are parsed. '''
+def parse_submissions(target_sub, high_water=None):
 	
-	threads, titles, ids = [], [], []
+	limit = MAX_BACKFILL if high_water is not None else FIRST_RUN_LIMIT
+	newest = high_water
+
 	submissions = []
-	for submission in subreddit.get_new(limit=10):
+	for submission in target_sub.get_new(limit=limit):
+		if high_water is not None and id_order(submission.id) <= high_water:
+			break
+		newest = max(newest, id_order(submission.id))
+
 		title = parse_title(submission.title)
 		if title:
 			thread = {
 					'sub'	: submission,
 					'title'	: title,
 					'id'	: submission.id,
-					'vid_id': get_video_id(submission.url)
+					'vid_id': get_video_id(submission.url),
+					'playlist': '?list=' in submission.url
 				  }
 			
 			submissions.append(thread)
 
-	return submissions
+	# Reddit lists the newest first, but we handle the oldest first.
+	return submissions[::-1], newest
+
+
+'''	Return a submission ID as a number. Reddit's IDs are base 36, and
+	increase over time, so newer submissions have larger numbers. '''
+def id_order(sub_id):
+
+	return int(sub_id, 36)
 
 
 '''	Parse the 'title', assuming the correct format is used. Toggle
@@ -70,109 +131,8 @@ def get_video_id(url):
 	else:
 		start = url.find('v=') + 2
 	
-	return url[start:]
-
-
-'''	Create valid query URLs for the Goodreads API. '''
-def linkify(titles):
-	
-	gr_base	= "https://www.goodreads.com/book/title.xml?title="
-	gr_suffix = "&key=" + GOODREADS_KEY
-	
-	urls = []
-	for title in titles:
-		url = gr_base + title + gr_suffix
-		urls.append(url)
-
-	return urls
-
-
-'''	Return an array containing the desired metadata from the given
-	Goodreads formatted URL. Toggle 'verbose' for error messages (if any). '''
-def get_book_data(url, verbose=False):
-
-	# Read in the XML from the given URL. If this fails, then we assume
-	# the book data does not exist on Goodreads.
-	import xmltodict
-	try:
-		r = requests.get(url)
-		xml = xmltodict.parse(r.text, force_list={'author': True})
-		book_data 	= xml['GoodreadsResponse']['book']
-	except Exception as book_not_found_error:
-		if verbose: print 'error: ' + str(book_not_found_error)
-		return
-
-	# Gather Book metadata.
-	body		= {}
-	body['title'] 	= book_data['title']
-	body['author']	= book_data['authors']['author'][0]['name']
-	
-	# If date is not available then we sub in 'n/a'.
-	l = lambda date_val: date_val if date_val != None else 'n/a'
-	body['date']	= ', '.join(map(l, [book_data['publication_year'], \
-			       		    book_data['publication_month'], \
-			       		    book_data['publication_day']]))
-	body['desc']	= strip_html(book_data['description'])
-	body['rating']	= book_data['average_rating']
-	if book_data['popular_shelves']:
-		body['tags'] = book_data['popular_shelves']['shelf'][2]['@name'], \
-			       book_data['popular_shelves']['shelf'][3]['@name'], \
-			       book_data['popular_shelves']['shelf'][4]['@name']
-	else:
-		body['tags'] = ('No', 'Tags', 'Available')
-
-	return body
-
-
-'''	Remove HTML tags in the given string. '''
-def strip_html(string):
-
-	import re
-	try:
-		html_cleaner = re.compile('<.*?>')
-		return re.sub(html_cleaner, '', string)
-	except Exception:
-		return "No description available."
-
-
-'''	Create valid query URLS for the Youtube API, using video IDs. '''
-def linkify_youtube(video_ids):
-
-	youtube_base 	= "https://www.googleapis.com/youtube/v3/videos?id="
-	youtube_suffix 	= "&part=contentDetails&key=" + YOUTUBE_KEY
-	
-	urls = []
-	for video_id in video_ids:
-		yt_url = youtube_base + video_id + youtube_suffix
-		urls.append(yt_url)
-
-	return urls
-
-
-'''	Get metadata from the given Youtube URL. '''
-def get_audio_data(url):
-	
-	import json
-	
-	r = requests.get(url)
-	json_data = json.loads(r.text)
-	
-	#TODO: Use the Youtube API to handle playlist requests. Returning
-	# 'Playlist' for now suffices, but is hardly very useful.
-	try:	
-		iso_duration = json_data['items'][0] \
-					['contentDetails'] \
-					['duration']
-	except IndexError:
-		return "unknown"
-	
-	'''	(Helper) Youtube returns video durations in ISO-8601 format.
-		We can convert this using the 'isodate' library. '''
-	def convert_iso(duration):
-		import isodate
-		return isodate.parse_duration(duration)
-
-	return str(convert_iso(iso_duration))
+	# Drop any other query parameters (e.g. '?t=30s' or '&t=30s').
+	return url[start:].split('?')[0].split('&')[0].split('#')[0]
 
 
 '''	Submit a comment to the thread with the given text body. '''
@@ -199,54 +159,103 @@ r = praw.Reddit(user_agent=USER_AGENT)
 r.login("AudioBookGuidev1", "YOUR REDDIT PASSWORD", disable_warning=True)
 subreddit = r.get_subreddit(TARGET_SUB)
 
+# Books and videos we've already looked up are kept on disk.
+with profile.startup('open metadata cache'):
+	metadata = MetadataCache(METADATA_FNAME, ttl=METADATA_TTL,
+				 negative_ttl=NEGATIVE_TTL,
+				 max_entries=METADATA_SIZE)
+
+# Goodreads and Youtube lookups are made concurrently, on a bounded pool.
+enricher = Enricher(metadata, GOODREADS_KEY, YOUTUBE_KEY,
+		    max_lookups=MAX_LOOKUPS, timeout=REQUEST_TIMEOUT,
+		    youtube_batch=YOUTUBE_BATCH,
+		    max_playlist_pages=MAX_PLAYLIST_PAGES,
+		    title_similarity=TITLE_SIMILARITY)
+
 # Cache parameters. The cache is necessary as we do not want to post in the
-# same thread each cycle.
-CACHE_SIZE=50
-CACHE_FNAME='abg-cache.pickle'
+# same thread each cycle. It remembers the newest CACHE_SIZE submissions.
+CACHE_SIZE=5000
+CACHE_FNAME='abg-seen.log'
+OLD_CACHE_FNAME='abg-cache.pickle'
+
+# Load the cache. If none exists, create a new one, starting with anything in
+# the old pickled cache.
+with profile.startup('load seen cache'):
+	cache = SeenStore(CACHE_FNAME, max_size=CACHE_SIZE)
+if not len(cache) and os.path.exists(OLD_CACHE_FNAME):
+	try:
+		with open(OLD_CACHE_FNAME, 'rb') as fp:
+			cache.add(*pickle.load(fp))
+	except Exception as load_error:
+		print str(load_error) + ": ignoring the old cache."
 
-# Load the cache. If none exists, create a new one. We're using cPickle to
-# serialize.
-try:
-	with open(CACHE_FNAME, 'rb') as fp:
-		cache = pickle.load(fp)
-except EOFError as eof_error:
-	cache = deque(maxlen=CACHE_SIZE)
-	print str(eof_error) + ": creating a new cache."
 
+# Comments are posted through a queue, so one failing thread can't hold up
+# the rest.
+posts = PostQueue(max_attempts=MAX_POST_ATTEMPTS, backoff=POST_BACKOFF,
+		  max_backoff=MAX_POST_BACKOFF, dead_fname=DEAD_LETTER_FNAME)
+
+# The high water mark is the newest submission we've handled. Each poll only
+# looks at submissions newer than it.
+high_water = max(id_order(sub_id) for sub_id in cache.ids) if len(cache) \
+	     else None
+interval = MIN_POLL_INTERVAL
 
 while True:
 	
-	subs = parse_submissions(subreddit)
+	subs, newest = parse_submissions(subreddit, high_water)
 	threads, titles, ids = [], [], []
+	playlists = set()
+	fresh = False
 	for sub in subs:
-		if sub['id'] not in cache:
+		if sub['id'] in cache or sub['id'] in posts:
+			continue
+
+		# A thread whose lookup failed before is only looked up again once
+		# its retry is due.
+		fresh = fresh or sub['id'] not in posts.lookups
+		if posts.lookup_due(sub['id']):
 			threads.append(sub['sub'])
 			titles.append(sub['title']), ids.append(sub['vid_id'])
-			cache.append(sub['id'])
-	
-	gr_links = linkify(titles)
-	yt_links = linkify_youtube(ids)
-	bad =[]	
+			if sub['playlist']:
+				playlists.add(sub['vid_id'])
 	
-	# Create a Reddit comment from the available book and video data.
-	for thread, gr_link, yt_link in zip(threads, gr_links, yt_links):
-		book = get_book_data(gr_link)
+	# Create a Reddit comment from the available book and video data. The
+	# lookups for the whole batch are made up front, and the comments are
+	# then posted in order. A thread whose lookup failed is retried later,
+	# until we give up on it.
+	books, failed = enricher.enrich(titles, ids, playlists)
+	done = []
+	for i, (thread, book) in enumerate(zip(threads, books)):
+		if i in failed:
+			if posts.lookup_failed(thread, failed[i]):
+				done.append(thread.id)
+			continue
+
+		posts.lookup_done(thread.id)
 		if book:
-			book['run_time'] = get_audio_data(yt_link)
-			comment = format_comment(book)
-			
-			# Attempt to post the comment. Remember to update cache.
-			posted = False
-			while posted is False:
-				try:
-					thread.add_comment(comment)
-					with open(CACHE_FNAME, 'wb') as fp:
-						pickle.dump(cache, fp)
-					posted = True
-				except Exception: 
-					sleep(120)
+			posts.put(thread, format_comment(book))
 		else:
-			bad.append(gr_link)
+			done.append(thread.id)
+
+	# Attempt to post the comments. Remember to update cache, once per
+	# cycle, with every thread we're done with.
+	done.extend(posts.run())
+	cache.add(*done)
+	profile.dump(PROFILE_FNAME)
+
+	# Poll quickly while new posts are coming in, and back off when it's
+	# quiet. Don't sleep through any retries that are due. The high water
+	# mark stays below any thread whose lookup is to be retried, so that
+	# it's polled again.
+	high_water = newest
+	for thread_id in posts.lookups:
+		high_water = min(high_water, id_order(thread_id) - 1)
+	if fresh:
+		interval = MIN_POLL_INTERVAL
+	else:
+		interval = min(MAX_POLL_INTERVAL, interval * 2)
 		
-	sleep(2400)
+	retry = posts.next_due()
+	sleep(min(interval, retry) if retry is not None else interval)
 
@@ -0,0 +1,159 @@
+'''
+				Benchmark.
+
+	Times the Goodreads book extraction against a recorded corpus of
+	Goodreads responses, comparing the targeted lxml extractor with the
+	xmltodict parse it replaced.
+
+		python benchmark.py [--iterations N]
+		python benchmark.py record <name> <url>
+		python benchmark.py memory <xmltodict|lxml> <file>
+
+	The corpus lives in fixtures/, one response per file. 'record' fetches
+	a live response and adds it to the corpus. The seed responses are
+	hand-built to the layout of Goodreads' book.title API.
+
+'''
+
+import os
+import sys
+import glob
+import resource
+import subprocess
+from time import time
+
+import requests
+import xmltodict
+from lxml import etree
+
+from goodreads import parse_book, strip_html
+
+
+FIXTURES_DIR=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ITERATIONS=200
+
+# The number of parsed documents held at once when measuring memory.
+RETAINED=100
+
+
+'''	Return the metadata from a Goodreads book response the way
+	get_book_data did before the lxml extractor. Kept as a baseline. '''
+def parse_book_xmltodict(content):
+
+	try:
+		xml = xmltodict.parse(content, force_list={'author': True})
+		book_data 	= xml['GoodreadsResponse']['book']
+	except Exception:
+		return
+
+	body		= {}
+	body['title'] 	= book_data['title']
+	body['author']	= book_data['authors']['author'][0]['name']
+	l = lambda date_val: date_val if date_val != None else 'n/a'
+	body['date']	= ', '.join(map(l, [book_data['publication_year'], \
+			       		    book_data['publication_month'], \
+			       		    book_data['publication_day']]))
+	body['desc']	= strip_html(book_data['description'])
+	body['rating']	= book_data['average_rating']
+	if book_data['popular_shelves']:
+		body['tags'] = book_data['popular_shelves']['shelf'][2]['@name'], \
+			       book_data['popular_shelves']['shelf'][3]['@name'], \
+			       book_data['popular_shelves']['shelf'][4]['@name']
+	else:
+		body['tags'] = ('No', 'Tags', 'Available')
+
+	return body
+
+
+'''	Return the resident set size of this process, in kilobytes. '''
+def rss():
+
+	with open('/proc/self/statm', 'r') as fp:
+		pages = int(fp.read().split()[1])
+	return pages * resource.getpagesize() // 1024
+
+
+'''	Return the mean time (in milliseconds) of extracting the metadata from
+	'content' with 'extract'. '''
+def bench(extract, content, iterations):
+
+	start = time()
+	for _ in range(iterations):
+		extract(content)
+
+	return (time() - start) / iterations * 1000
+
+
+'''	Return the memory (in kilobytes) of the document the given parser
+	('xmltodict' or 'lxml') builds for a response. Measured in a fresh
+	interpreter, so that memory freed by earlier runs can't hide it. '''
+def memory(parser, fname):
+
+	output = subprocess.check_output([sys.executable,
+					  os.path.abspath(__file__),
+					  'memory', parser, fname])
+	return float(output)
+
+
+'''	Print the memory (in kilobytes) of the document the given parser
+	builds for a response. Several documents are held at once, so that the
+	difference shows up in the process' memory. '''
+def measure(parser, fname):
+
+	parse = xmltodict.parse if parser == 'xmltodict' else etree.fromstring
+	with open(fname, 'rb') as fp:
+		content = fp.read()
+
+	before = rss()
+	held = [parse(content) for _ in range(RETAINED)]
+	print float(rss() - before) / len(held)
+
+
+'''	Run the benchmark over every response in the corpus, and print the
+	results as a table. '''
+def run(iterations):
+
+	row = '{:<40} {:>12} {:>12} {:>12} {:>12}'
+	print row.format('response', 'xmltodict ms', 'lxml ms', 'xmltodict kb',
+			 'lxml kb')
+
+	for fname in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.xml'))):
+		with open(fname, 'rb') as fp:
+			content = fp.read()
+
+		# Both extractors should agree before we compare them.
+		old, new = parse_book_xmltodict(content), parse_book(content)
+		if old != new:
+			print 'mismatch: ', os.path.basename(fname), old, new
+
+		print row.format(os.path.basename(fname)[:40],
+				 '%.3f' % bench(parse_book_xmltodict, content, iterations),
+				 '%.3f' % bench(parse_book, content, iterations),
+				 '%.1f' % memory('xmltodict', fname),
+				 '%.1f' % memory('lxml', fname))
+
+
+'''	Fetch a live Goodreads response, and add it to the corpus. '''
+def record(name, url):
+
+	r = requests.get(url, timeout=10)
+	r.raise_for_status()
+	fname = os.path.join(FIXTURES_DIR, 'goodreads-' + name + '.xml')
+	with open(fname, 'wb') as fp:
+		fp.write(r.content)
+
+	print 'recorded ' + url + ' -> ' + fname
+
+
+if __name__=='__main__':
+
+	args = sys.argv[1:]
+	if args and args[0] == 'record':
+		record(args[1], args[2])
+	elif args and args[0] == 'memory':
+		measure(args[1], args[2])
+	else:
+		iterations = ITERATIONS
+		if '--iterations' in args:
+			iterations = int(args[args.index('--iterations') + 1])
+		run(iterations)
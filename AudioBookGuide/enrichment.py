@@ -0,0 +1,274 @@
+'''
+				Enrichment.
+
+	Looks up the book (on Goodreads) and audio run-time (on Youtube) behind
+	a batch of submissions. Everything a lookup needs (imports, compiled
+	XPaths and regexes, the lookup pool, the title index) is set up once,
+	when the module is imported and the Enricher is created, so that each
+	lookup only pays for its own work. Both costs are recorded in the
+	shared profile.
+
+'''
+
+from profiler import profile
+
+with profile.startup('import'):
+	import json
+	import isodate
+	import requests
+	from urllib import quote_plus
+	from datetime import timedelta
+	from multiprocessing.pool import ThreadPool
+	from goodreads import parse_book
+	from title_index import TitleIndex, normalize_title
+
+
+GOODREADS_URL	= "https://www.goodreads.com/book/title.xml?title="
+VIDEOS_URL	= "https://www.googleapis.com/youtube/v3/videos?id="
+PLAYLIST_URL	= "https://www.googleapis.com/youtube/v3/playlistItems?playlistId="
+
+
+class Enricher(object):
+
+	'''	Create an enricher. Lookups are cached in 'metadata', at most
+		'max_lookups' requests are made at once, and each is given up on
+		after 'timeout' seconds. Youtube is asked about at most
+		'youtube_batch' videos per request, and at most 'max_playlist_pages'
+		pages of a playlist are read. A title resolves to a book we've
+		already found if their similarity is at least 'title_similarity'. '''
+	def __init__(self, metadata, goodreads_key, youtube_key, max_lookups,
+		     timeout, youtube_batch, max_playlist_pages, title_similarity):
+
+		self.metadata		= metadata
+		self.goodreads_key	= goodreads_key
+		self.youtube_key	= youtube_key
+		self.timeout		= timeout
+		self.youtube_batch	= youtube_batch
+		self.max_playlist_pages	= max_playlist_pages
+
+		with profile.startup('start lookup pool'):
+			self.pool = ThreadPool(max_lookups)
+
+		# The books we've found so far are indexed by title, to resolve
+		# near matches.
+		with profile.startup('build title index'):
+			self.titles = TitleIndex(threshold=title_similarity)
+			for key, book in metadata.items('book'):
+				self.titles.add(key, book)
+				self.titles.add(normalize_title(book['title']), book)
+
+	'''	Create valid query URLs for the Goodreads API. '''
+	def linkify(self, titles):
+
+		gr_suffix = "&key=" + self.goodreads_key
+
+		urls = []
+		for title in titles:
+			url = GOODREADS_URL + quote_plus(title.strip().encode('utf-8')) + \
+			      gr_suffix
+			urls.append(url)
+
+		return urls
+
+	'''	Return the book data for the given title, from the metadata cache
+		if we've looked it up before, or the title index if it's close to a
+		book we've found before. A title that Goodreads doesn't know is
+		cached as such, but a failed request isn't cached at all, and its
+		RequestException is raised. '''
+	def lookup_book(self, title, url):
+
+		key = normalize_title(title)
+		with profile.call('book cache'):
+			hit, book = self.metadata.get('book', key)
+		if hit:
+			return book
+
+		with profile.call('title index'):
+			book = self.titles.resolve(key)
+		if book:
+			self.metadata.put('book', key, book)
+			return book
+
+		book = self.get_book_data(url)
+
+		# Index the book under both the posted title, and its Goodreads title.
+		self.metadata.put('book', key, book)
+		if book:
+			self.titles.add(key, book)
+			self.titles.add(normalize_title(book['title']), book)
+
+		return book
+
+	'''	Return an array containing the desired metadata from the given
+		Goodreads formatted URL. Toggle 'verbose' for error messages (if
+		any). Raises a RequestException if Goodreads couldn't be reached,
+		or had an error of its own. '''
+	def get_book_data(self, url, verbose=False):
+
+		with profile.call('goodreads fetch'):
+			r = requests.get(url, timeout=self.timeout)
+		if r.status_code >= 500 or r.status_code == 429:
+			r.raise_for_status()
+
+		# Read in the XML from the response. If this fails, then we assume
+		# the book data does not exist on Goodreads.
+		with profile.call('goodreads parse'):
+			return parse_book(r.content, verbose)
+
+	'''	Create valid query URLS for the Youtube API, using video IDs. Each
+		URL looks up as many as 'youtube_batch' videos at once. '''
+	def linkify_youtube(self, video_ids):
+
+		youtube_suffix 	= "&part=contentDetails&key=" + self.youtube_key
+
+		urls = []
+		for i in range(0, len(video_ids), self.youtube_batch):
+			yt_url = VIDEOS_URL + \
+				 ','.join(video_ids[i:i + self.youtube_batch]) + \
+				 youtube_suffix
+			urls.append(yt_url)
+
+		return urls
+
+	'''	Create a valid query URL for a page of a Youtube playlist's items. '''
+	def linkify_playlist(self, playlist_id, page_token=None):
+
+		playlist_suffix	= "&part=contentDetails&maxResults=" + \
+				  str(self.youtube_batch) + "&key=" + self.youtube_key
+
+		url = PLAYLIST_URL + playlist_id + playlist_suffix
+		if page_token:
+			url += "&pageToken=" + page_token
+
+		return url
+
+	'''	Return the JSON response from the given URL, or None if the
+		request fails, or Youtube returns an error (e.g. its quota is
+		exceeded). '''
+	def get_json(self, url):
+
+		try:
+			with profile.call('youtube fetch'):
+				r = requests.get(url, timeout=self.timeout)
+			r.raise_for_status()
+			json_data = json.loads(r.text)
+		except (requests.RequestException, ValueError):
+			return
+
+		if not isinstance(json_data, dict) or 'error' in json_data:
+			return
+
+		return json_data
+
+	'''	Return the IDs of the videos in the given playlist. Long playlists
+		are read in pages of 'youtube_batch' items, up to
+		'max_playlist_pages' pages. '''
+	def get_playlist_items(self, playlist_id):
+
+		video_ids, page_token = [], None
+		for _ in range(self.max_playlist_pages):
+			json_data = self.get_json(self.linkify_playlist(playlist_id,
+									page_token))
+			if not json_data:
+				break
+
+			for item in json_data.get('items', []):
+				video_ids.append(item['contentDetails']['videoId'])
+
+			page_token = json_data.get('nextPageToken')
+			if not page_token:
+				break
+
+		return video_ids
+
+	'''	Get the audio run-time of every given video and playlist, in as
+		few requests as possible. A playlist's run-time is the sum of its
+		videos'. Return a dict mapping each ID to its run-time, or
+		"unknown" if we couldn't find it. '''
+	def get_audio_data(self, video_ids, playlist_ids):
+
+		# Anything we've looked up before comes from the metadata cache.
+		run_times = {}
+		with profile.call('audio cache', items=len(set(video_ids))):
+			for v_id in set(video_ids):
+				kind = 'playlist' if v_id in playlist_ids else 'video'
+				hit, run_time = self.metadata.get(kind, v_id)
+				if hit:
+					run_times[v_id] = run_time or "unknown"
+
+		# Expand each playlist into its videos, so that every video can be
+		# looked up in the same batched requests.
+		playlist_ids = [p_id for p_id in set(video_ids)
+				if p_id in playlist_ids and p_id not in run_times]
+		playlists = dict(zip(playlist_ids,
+				     self.pool.map(self.get_playlist_items,
+						   playlist_ids)))
+
+		lookups = set(v_id for v_id in video_ids
+			      if v_id not in playlists and v_id not in run_times)
+		for items in playlists.values():
+			lookups.update(items)
+
+		# Youtube returns video durations in ISO-8601 format. We can convert
+		# this using the 'isodate' library. A video missing from a
+		# successful response doesn't exist (or is private).
+		lookups = sorted(lookups)
+		durations, not_found = {}, set()
+		for i, json_data in enumerate(self.pool.map(self.get_json,
+						self.linkify_youtube(lookups))):
+			if json_data is None:
+				continue
+
+			batch = lookups[i * self.youtube_batch:(i + 1) * self.youtube_batch]
+			items = json_data.get('items', [])
+			with profile.call('youtube parse', items=len(items)):
+				for item in items:
+					durations[item['id']] = isodate.parse_duration(
+							item['contentDetails']['duration'])
+			not_found.update(v_id for v_id in batch if v_id not in durations)
+
+		for v_id in set(video_ids) - set(run_times):
+			if v_id in playlists:
+				items = [durations[i] for i in playlists[v_id]
+					 if i in durations]
+				run_times[v_id] = str(sum(items, timedelta())) if items \
+						  else "unknown"
+				if items:
+					self.metadata.put('playlist', v_id, run_times[v_id])
+			elif v_id in durations:
+				run_times[v_id] = str(durations[v_id])
+				self.metadata.put('video', v_id, run_times[v_id])
+			else:
+				run_times[v_id] = "unknown"
+				if v_id in not_found:
+					self.metadata.put('video', v_id, None)
+
+		return run_times
+
+	'''	Look up the book and audio data for a batch of submissions at
+		once, on the lookup pool. Return a list of book data (or None,
+		where the book wasn't found) in the same order as the given titles,
+		so that the whole batch takes as long as its slowest lookup, along
+		with a dict mapping the index of each lookup that failed (and
+		should be retried) to its error. '''
+	def enrich(self, titles, video_ids, playlist_ids):
+
+		with profile.call('enrich', items=len(titles)):
+			books = [self.pool.apply_async(self.lookup_book, (title, gr_link))
+				 for title, gr_link in zip(titles, self.linkify(titles))]
+			run_times = self.get_audio_data(video_ids, playlist_ids)
+
+			results, failed = [], {}
+			for i, (book, video_id) in enumerate(zip(books, video_ids)):
+				try:
+					book = book.get()
+				except requests.RequestException as request_error:
+					print 'error: ' + str(request_error)
+					book = None
+					failed[i] = str(request_error)
+
+				if book:
+					book = dict(book, run_time=run_times[video_id])
+				results.append(book)
+
+		return results, failed
@@ -0,0 +1,72 @@
+'''
+				Goodreads.
+
+	Pulls the handful of fields we use out of a Goodreads book response.
+	Each field is read with a precompiled XPath, so the rest of the document
+	(reviews widget, similar books, the full shelf list, etc.) is never
+	converted into Python objects.
+
+'''
+
+import re
+from HTMLParser import HTMLParser
+from lxml import etree
+
+
+# Precompiled paths to the only fields we read from a Goodreads book.
+BOOK		= etree.XPath('/GoodreadsResponse/book')
+TITLE		= etree.XPath('string(title)')
+AUTHOR		= etree.XPath('string(authors/author[1]/name)')
+YEAR		= etree.XPath('publication_year/text()')
+MONTH		= etree.XPath('publication_month/text()')
+DAY		= etree.XPath('publication_day/text()')
+DESCRIPTION	= etree.XPath('description/text()')
+RATING		= etree.XPath('string(average_rating)')
+SHELVES		= etree.XPath('popular_shelves/shelf[position() >= 3 and '
+			      'position() <= 5]/@name')
+
+# Descriptions are HTML, e.g. 'Paul&apos;s <i>destiny</i>'. We keep the text.
+HTML_TAG	= re.compile('<.*?>', re.DOTALL)
+HTML_ENTITIES	= HTMLParser()
+
+
+'''	Return a dict of the desired metadata from the given Goodreads book
+	response (as bytes), or None if the response isn't a book. Toggle
+	'verbose' for error messages (if any). '''
+def parse_book(content, verbose=False):
+
+	try:
+		book = BOOK(etree.fromstring(content))[0]
+	except (etree.XMLSyntaxError, ValueError, IndexError) as book_not_found_error:
+		if verbose: print 'error: ' + str(book_not_found_error)
+		return
+
+	# Gather Book metadata.
+	body		= {}
+	body['title'] 	= TITLE(book)
+	body['author']	= AUTHOR(book)
+
+	# If date is not available then we sub in 'n/a'.
+	l = lambda date_val: date_val[0] if date_val else 'n/a'
+	body['date']	= ', '.join(map(l, [YEAR(book), MONTH(book), DAY(book)]))
+	body['desc']	= strip_html(''.join(DESCRIPTION(book)) or None)
+	body['rating']	= RATING(book)
+
+	# Skip the first two shelves, which are nearly always 'to-read' and
+	# 'currently-reading'.
+	shelves = SHELVES(book)
+	if len(shelves) == 3:
+		body['tags'] = tuple(shelves)
+	else:
+		body['tags'] = ('No', 'Tags', 'Available')
+
+	return body
+
+
+'''	Remove HTML tags in the given string, and decode its entities. '''
+def strip_html(string):
+
+	if string is None:
+		return "No description available."
+
+	return HTML_ENTITIES.unescape(HTML_TAG.sub('', string))
@@ -0,0 +1,95 @@
+'''
+				Metadata Cache.
+
+	An on-disk cache of Goodreads and Youtube lookups, so that a book (or a
+	video) we've already looked up costs no API calls. Entries expire after
+	a TTL, the least recently used entries are evicted once the cache is
+	full, and 'not found' results are cached too (for a shorter TTL).
+
+'''
+
+import json
+import sqlite3
+import threading
+from time import time
+
+
+SCHEMA = '''
+	CREATE TABLE IF NOT EXISTS metadata (
+		kind	TEXT NOT NULL,
+		key	TEXT NOT NULL,
+		value	TEXT,
+		expires	REAL NOT NULL,
+		used	REAL NOT NULL,
+		PRIMARY KEY (kind, key)
+	)
+'''
+
+
+class MetadataCache(object):
+
+	'''	Open (or create) the cache at 'path'. Found entries live for 'ttl'
+		seconds, and not found entries for 'negative_ttl' seconds. At most
+		'max_entries' entries are kept. '''
+	def __init__(self, path, ttl, negative_ttl, max_entries):
+
+		self.ttl		= ttl
+		self.negative_ttl	= negative_ttl
+		self.max_entries	= max_entries
+
+		self.lock = threading.Lock()
+		self.db = sqlite3.connect(path, check_same_thread=False)
+		self.db.execute('PRAGMA journal_mode=WAL')
+		self.db.execute(SCHEMA)
+		self.db.commit()
+
+	'''	Look up an entry. Return a (hit, value) tuple, where 'value' is None
+		for a cached 'not found'. '''
+	def get(self, kind, key):
+
+		now = time()
+		with self.lock:
+			row = self.db.execute('SELECT value FROM metadata WHERE '
+					      'kind = ? AND key = ? AND expires > ?',
+					      (kind, key, now)).fetchone()
+			if row is None:
+				return False, None
+
+			self.db.execute('UPDATE metadata SET used = ? WHERE '
+					'kind = ? AND key = ?', (now, kind, key))
+			self.db.commit()
+
+		return True, json.loads(row[0]) if row[0] is not None else None
+
+	'''	Return a list of (key, value) tuples for every entry of the given
+		kind that's been found, and hasn't expired. '''
+	def items(self, kind):
+
+		with self.lock:
+			rows = self.db.execute('SELECT key, value FROM metadata WHERE '
+					       'kind = ? AND value IS NOT NULL AND '
+					       'expires > ?', (kind, time())).fetchall()
+
+		return [(row[0], json.loads(row[1])) for row in rows]
+
+	'''	Cache a lookup's result. A 'value' of None caches a 'not found'. '''
+	def put(self, kind, key, value):
+
+		now = time()
+		if value is None:
+			expires, value = now + self.negative_ttl, None
+		else:
+			expires, value = now + self.ttl, json.dumps(value)
+
+		with self.lock:
+			self.db.execute('INSERT OR REPLACE INTO metadata '
+					'VALUES (?, ?, ?, ?, ?)',
+					(kind, key, value, expires, now))
+
+			# Drop anything that's expired, then the least recently used
+			# entries until we're back under the limit.
+			self.db.execute('DELETE FROM metadata WHERE expires <= ?', (now,))
+			self.db.execute('DELETE FROM metadata WHERE rowid IN ('
+					'SELECT rowid FROM metadata ORDER BY used DESC '
+					'LIMIT -1 OFFSET ?)', (self.max_entries,))
+			self.db.commit()
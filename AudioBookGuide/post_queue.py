@@ -0,0 +1,148 @@
+'''
+				Post Queue.
+
+	Holds the comments waiting to be posted. Each run tries every comment
+	that's due once, so a thread that keeps failing doesn't hold up the
+	others. A failed comment is retried after an exponential backoff, and
+	given up on after 'max_attempts' tries, at which point it's written to
+	the dead letter file. Threads whose book lookup failed are retried (and
+	given up on) the same way.
+
+'''
+
+import json
+from time import time
+
+
+class PostQueue(object):
+
+	'''	Create a queue. The first retry waits 'backoff' seconds, and each
+		one after that twice as long, up to 'max_backoff'. Comments we
+		give up on are appended to 'dead_fname'. '''
+	def __init__(self, max_attempts, backoff, max_backoff, dead_fname):
+
+		self.max_attempts	= max_attempts
+		self.backoff		= backoff
+		self.max_backoff	= max_backoff
+		self.dead_fname		= dead_fname
+
+		self.pending	= []
+		self.dead	= []
+
+		# The threads whose lookup failed, by ID.
+		self.lookups	= {}
+
+	def __len__(self):
+
+		return len(self.pending)
+
+	'''	Return True if a comment for the thread with the given ID is
+		waiting to be posted. '''
+	def __contains__(self, thread_id):
+
+		return any(item['thread'].id == thread_id for item in self.pending)
+
+	'''	Queue a comment to be posted to the given thread. '''
+	def put(self, thread, comment):
+
+		self.pending.append({
+				'thread'	: thread,
+				'comment'	: comment,
+				'attempts'	: 0,
+				'next_try'	: 0
+		})
+
+	'''	Try to post every comment that's due. Return the IDs of the threads
+		we're done with, i.e. that were either posted to or given up on. '''
+	def run(self):
+
+		now = time()
+		done, dead = [], []
+		for item in self.pending[:]:
+			if item['next_try'] > now:
+				continue
+
+			try:
+				item['thread'].add_comment(item['comment'])
+			except Exception as post_error:
+				print 'error: ' + item['thread'].id + ': ' + str(post_error)
+				if self._retry(item, now):
+					continue
+
+				dead.append({
+						'id'		: item['thread'].id,
+						'comment'	: item['comment'],
+						'error'		: str(post_error),
+						'time'		: now
+				})
+
+			self.pending.remove(item)
+			done.append(item['thread'].id)
+
+		self._dead_letter(dead)
+		return done
+
+	'''	Return True if the lookup for the thread with the given ID should
+		be made, i.e. it hasn't failed, or its retry is due. '''
+	def lookup_due(self, thread_id):
+
+		item = self.lookups.get(thread_id)
+		return item is None or item['next_try'] <= time()
+
+	'''	Record that the lookup for a thread succeeded. '''
+	def lookup_done(self, thread_id):
+
+		self.lookups.pop(thread_id, None)
+
+	'''	Record that the lookup for a thread failed. Return True if we've
+		given up on it, in which case it's written to the dead letter
+		file. '''
+	def lookup_failed(self, thread, error):
+
+		now = time()
+		item = self.lookups.setdefault(thread.id, {'attempts': 0,
+							   'next_try': 0})
+		if self._retry(item, now):
+			return False
+
+		del self.lookups[thread.id]
+		self._dead_letter([{
+				'id'		: thread.id,
+				'comment'	: None,
+				'error'		: 'lookup: ' + error,
+				'time'		: now
+		}])
+		return True
+
+	'''	Return the number of seconds until the next retry is due, or None
+		if nothing is waiting. '''
+	def next_due(self):
+
+		items = self.pending + self.lookups.values()
+		if not items:
+			return
+
+		return max(0, min(item['next_try'] for item in items) - time())
+
+	'''	Count a failed attempt. Return True if the item should be tried
+		again, after an exponential backoff. '''
+	def _retry(self, item, now):
+
+		item['attempts'] += 1
+		if item['attempts'] >= self.max_attempts:
+			return False
+
+		delay = self.backoff * 2 ** (item['attempts'] - 1)
+		item['next_try'] = now + min(delay, self.max_backoff)
+		return True
+
+	'''	Write the entries we gave up on to the dead letter file, one JSON
+		object per line, so they can be posted by hand. '''
+	def _dead_letter(self, entries):
+
+		if not entries:
+			return
+
+		self.dead.extend(entries)
+		with open(self.dead_fname, 'a') as fp:
+			fp.write(''.join(json.dumps(entry) + '\n' for entry in entries))
@@ -0,0 +1,85 @@
+'''
+				Profiler.
+
+	Records how long the bot spends starting up (imports, opening caches,
+	building the title index) separately from the time each lookup takes,
+	so that one-off costs and per-item overhead can be told apart. Every
+	module records into the shared 'profile' at the bottom of this file.
+
+		with profile.startup('open metadata cache'): ...
+		with profile.call('goodreads parse', items=1): ...
+
+'''
+
+import threading
+from time import time
+from contextlib import contextmanager
+
+
+class Profile(object):
+
+	'''	Create an empty profile. '''
+	def __init__(self):
+
+		self.steps	= []
+		self.calls	= {}
+		self.lock	= threading.Lock()
+
+	'''	Time a one-off startup step. '''
+	@contextmanager
+	def startup(self, name):
+
+		start = time()
+		try:
+			yield
+		finally:
+			with self.lock:
+				self.steps.append((name, time() - start))
+
+	'''	Time a call that handles 'items' items (e.g. a batched request). '''
+	@contextmanager
+	def call(self, name, items=1):
+
+		start = time()
+		try:
+			yield
+		finally:
+			elapsed = time() - start
+			with self.lock:
+				calls, total, count = self.calls.get(name, (0, 0.0, 0))
+				self.calls[name] = (calls + 1, total + elapsed, count + items)
+
+	'''	Return the profile as a plain text report. Times are in
+		milliseconds. '''
+	def report(self):
+
+		with self.lock:
+			steps, calls = list(self.steps), dict(self.calls)
+
+		lines = ['{:<32} {:>10}'.format('startup', 'ms')]
+		for name, elapsed in steps:
+			lines.append('{:<32} {:>10.1f}'.format(name, elapsed * 1000))
+		lines.append('{:<32} {:>10.1f}'.format('total', 1000 *
+				sum(elapsed for _, elapsed in steps)))
+
+		lines.append('')
+		lines.append('{:<32} {:>8} {:>8} {:>10} {:>10} {:>10}'.format(
+				'call', 'calls', 'items', 'total ms', 'ms/call',
+				'ms/item'))
+		for name in sorted(calls):
+			count, total, items = calls[name]
+			lines.append('{:<32} {:>8} {:>8} {:>10.1f} {:>10.2f} {:>10.2f}'
+				     .format(name, count, items, total * 1000,
+					     total * 1000 / count,
+					     total * 1000 / items if items else 0))
+
+		return '\n'.join(lines) + '\n'
+
+	'''	Write the report to the given file. '''
+	def dump(self, fname):
+
+		with open(fname, 'w') as fp:
+			fp.write(self.report())
+
+
+profile = Profile()
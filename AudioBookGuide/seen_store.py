@@ -0,0 +1,95 @@
+'''
+				Seen Store.
+
+	Remembers the IDs of the submissions we've already handled, so that we
+	never comment on the same thread twice. IDs are held in a set for quick
+	lookups, and appended to a log file as they're added. Once the log grows
+	to twice 'max_size' it's compacted down to the newest 'max_size' IDs.
+
+'''
+
+import os
+from collections import deque
+
+
+class SeenStore(object):
+
+	'''	Open (or create) the store, with its log at 'path'. The newest
+		'max_size' IDs are remembered. '''
+	def __init__(self, path, max_size):
+
+		self.path	= path
+		self.max_size	= max_size
+		self.order	= deque()
+		self.ids	= set()
+		self.logged	= 0
+
+		partial = False
+		if os.path.exists(path):
+			with open(path, 'r') as fp:
+				lines = fp.read().split('\n')
+
+			# A crash mid-append can leave a partial last line. Every
+			# complete line ends with a newline, so the last piece is
+			# either empty or partial, and is dropped either way.
+			for sub_id in lines[:-1]:
+				self._remember(sub_id)
+			self.logged = len(lines) - 1
+			partial = lines[-1] != ''
+
+		# Rewrite the log now if it has a partial line, so that the next
+		# ID isn't appended onto the end of it.
+		self.log = open(path, 'a')
+		if partial or self.logged >= 2 * self.max_size:
+			self.compact()
+
+	def __contains__(self, sub_id):
+
+		return sub_id in self.ids
+
+	def __len__(self):
+
+		return len(self.ids)
+
+	'''	Add the given IDs to the store, and append them to the log. '''
+	def add(self, *sub_ids):
+
+		new = [sub_id for sub_id in sub_ids if sub_id not in self.ids]
+		if not new:
+			return
+
+		for sub_id in new:
+			self._remember(sub_id)
+
+		self.log.write(''.join(sub_id + '\n' for sub_id in new))
+		self.log.flush()
+		os.fsync(self.log.fileno())
+		self.logged += len(new)
+
+		if self.logged >= 2 * self.max_size:
+			self.compact()
+
+	'''	Rewrite the log with only the IDs we remember. We write to a
+		temporary file first, so a crash can't leave a half written log. '''
+	def compact(self):
+
+		with open(self.path + '.tmp', 'w') as fp:
+			fp.write(''.join(sub_id + '\n' for sub_id in self.order))
+			fp.flush()
+			os.fsync(fp.fileno())
+
+		self.log.close()
+		os.rename(self.path + '.tmp', self.path)
+		self.log = open(self.path, 'a')
+		self.logged = len(self.order)
+
+	'''	Add an ID to the set, forgetting the oldest ID if we're full. '''
+	def _remember(self, sub_id):
+
+		if sub_id in self.ids:
+			return
+
+		self.order.append(sub_id)
+		self.ids.add(sub_id)
+		if len(self.order) > self.max_size:
+			self.ids.discard(self.order.popleft())
@@ -0,0 +1,107 @@
+'''
+				Title Index.
+
+	A local index of the books we've already resolved, so that a title
+	that's close to one we've seen (different punctuation, a typo, an extra
+	word) resolves without asking Goodreads. Titles are compared by the
+	overlap of their character trigrams, and must have the same numbers, so
+	that one volume of a series never resolves to another.
+
+'''
+
+import re
+import threading
+
+
+# Words that say nothing about which book a title is.
+NOISE_WORDS = set([
+		'a', 'an', 'the', 'audiobook', 'audio', 'book', 'unabridged',
+		'abridged', 'full', 'complete', 'read', 'by'
+])
+
+
+'''	Normalize a title, so that the same book posted with different
+	spacing, capitalization, punctuation or filler words gets the same
+	title. '''
+def normalize_title(title):
+
+	tokens = re.sub(r'[^a-z0-9]+', ' ', title.lower()).split()
+	return ' '.join(token for token in tokens if token not in NOISE_WORDS)
+
+
+'''	Return the set of numbers (e.g. volume numbers) in a normalized
+	title. '''
+def numbers(title):
+
+	return frozenset(token for token in title.split() if token.isdigit())
+
+
+'''	Return the set of character trigrams in a normalized title. '''
+def trigrams(title):
+
+	padded = '  ' + title + ' '
+	return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TitleIndex(object):
+
+	'''	Create an empty index. A title resolves to an indexed book if their
+		trigram similarity is at least 'threshold' (between 0 and 1). '''
+	def __init__(self, threshold):
+
+		self.threshold	= threshold
+		self.books	= {}
+		self.grams	= {}
+		self.numbers	= {}
+		self.postings	= {}
+		self.lock	= threading.Lock()
+
+	def __len__(self):
+
+		return len(self.books)
+
+	'''	Index (a copy of) a book under the given normalized title. '''
+	def add(self, title, book):
+
+		if not title:
+			return
+
+		with self.lock:
+			self.books[title] = dict(book)
+			if title in self.grams:
+				return
+
+			self.grams[title] = trigrams(title)
+			self.numbers[title] = numbers(title)
+			for gram in self.grams[title]:
+				self.postings.setdefault(gram, set()).add(title)
+
+	'''	Return a copy of the book indexed under the title most similar to
+		the given normalized title, or None if none are similar enough. '''
+	def resolve(self, title):
+
+		if not title:
+			return
+
+		grams, nums = trigrams(title), numbers(title)
+		with self.lock:
+			if title in self.books:
+				return dict(self.books[title])
+
+			# Count the trigrams each indexed title shares with ours.
+			shared = {}
+			for gram in grams:
+				for other in self.postings.get(gram, ()):
+					shared[other] = shared.get(other, 0) + 1
+
+			best, best_score = None, 0
+			for other, count in shared.items():
+				if self.numbers[other] != nums:
+					continue
+
+				score = float(count) / (len(grams) + len(self.grams[other]) - count)
+				if score > best_score:
+					best, best_score = other, score
+
+			if best_score >= self.threshold:
+				return dict(self.books[best])
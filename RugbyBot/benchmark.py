@@ -0,0 +1,367 @@
+#
+# Benchmark: Times the scraping layer against a recorded corpus of ESPN
+# pages, served from a local stand-in for ESPN.
+#
+#	python benchmark.py [--iterations N] [--json]
+#	python benchmark.py record <url> [<url> ...]
+#	python benchmark.py memory <file>
+#
+# The corpus lives in fixtures/, and manifest.json maps each request path
+# (e.g. '/rugby/match?gameId=290001') to the file that is served for it.
+# 'record' fetches live pages and adds them to the corpus. The seed pages
+# are hand-built to the layout the selectors in xpaths.py expect. 'memory'
+# prints the memory held by one parsed tree of a page in the corpus.
+#
+# ========================================================================
+
+
+import os
+import sys
+import json
+import time
+import resource
+import threading
+import subprocess
+
+from datetime import datetime
+
+import BaseHTTPServer
+import SocketServer
+
+from urlparse import urlparse
+
+import requests
+from lxml import html
+
+import render
+import rugby_bot
+from xpaths import select_one
+from fake_reddit import FakeReddit
+
+
+FIXTURES_DIR  = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+			     'fixtures')
+MANIFEST      = os.path.join(FIXTURES_DIR, 'manifest.json')
+ITERATIONS    = 50
+
+# The number of parsed trees held at once when measuring memory.
+RETAINED      = 100
+
+
+''' Returns the fixture manifest, mapping request paths to file names. '''
+def load_manifest():
+
+	with open(MANIFEST, 'r') as fp:
+		return json.load(fp)
+
+
+'''   Serves the fixture corpus over HTTP, so pages are fetched exactly as
+      they would be from ESPN. '''
+class FixtureHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+	def do_GET(self):
+
+		fname = self.server.manifest.get(self.path)
+		if fname is None:
+			self.send_error(404)
+			return
+
+		with open(os.path.join(FIXTURES_DIR, fname), 'rb') as fp:
+			body = fp.read()
+
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/html; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	# Keep the benchmark output readable.
+	def log_message(self, *args):
+		pass
+
+
+class FixtureServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+	daemon_threads = True
+
+	''' Start serving the corpus in the background.
+	    Args:
+	    	port: The local port to serve on. Defaults to any free port.
+	'''
+	def __init__(self, port=0):
+
+		BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port),
+						   FixtureHandler)
+		self.manifest = load_manifest()
+		self.url      = 'http://127.0.0.1:' + str(self.server_port)
+
+		thread = threading.Thread(target=self.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+
+''' Returns the resident set size of this process, in kilobytes. '''
+def rss():
+
+	with open('/proc/self/statm', 'r') as fp:
+		pages = int(fp.read().split()[1])
+	return pages * resource.getpagesize() // 1024
+
+
+''' Returns the memory (in kilobytes) held by one parsed tree of the given
+    page. Measured in a fresh interpreter, so that memory freed by earlier
+    benchmarks can't hide it.
+    Args:
+	fname: The path of the page.
+'''
+def memory(fname):
+
+	output = subprocess.check_output([sys.executable,
+					  os.path.abspath(__file__),
+					  'memory', fname])
+	return float(output)
+
+
+''' Print the memory (in kilobytes) held by one parsed tree of the given
+    page. Several trees are held at once, so that the difference shows up in
+    the process' memory.
+    Args:
+	fname: The path of the page.
+'''
+def measure(fname):
+
+	with open(fname, 'rb') as fp:
+		content = fp.read()
+
+	before = rss()
+	held = [html.fromstring(content) for _ in range(RETAINED)]
+	print float(rss() - before) / len(held)
+
+
+''' Call fn the given number of times, and return its timing statistics.
+    Args:
+	name: The name to report the results under.
+	fn: The callable to time.
+	iterations: The number of times to call it.
+'''
+def bench(name, fn, iterations):
+
+	samples = []
+	for _ in range(iterations):
+		start = time.time()
+		fn()
+		samples.append(time.time() - start)
+
+	samples.sort()
+	total = sum(samples)
+	return {
+			'name': name,
+			'calls': iterations,
+			'mean_ms': (total / iterations) * 1000,
+			'p50_ms': samples[iterations // 2] * 1000,
+			'p95_ms': samples[int(iterations * 0.95) - 1] * 1000,
+			'per_sec': iterations / total if total else float('inf'),
+			'tree_kb': None
+	}
+
+
+''' Returns a list of polls in which the score and game clock move and a
+    new event arrives. Each poll is a (score, game time, events section)
+    tuple.
+    Args:
+	match: A Match whose thread has been rendered.
+	n: The number of polls.
+'''
+def live_polls(match, n):
+
+	polls, events = [], match.events.section
+	for i in range(n):
+		events += "\n\n**" + str(i % 80) + "'**  Event " + str(i)
+		polls.append(((str(i), str(i // 2)), str(i % 80) + "'", events))
+
+	return polls
+
+
+''' Render a poll's update the way Match did before render.py: rebuild the
+    header by concatenation, and concatenate the body. Kept as a baseline
+    for the render benchmarks.
+    Args:
+	match: A Match whose thread has been rendered.
+	score: The (home score, away score) scraped this poll.
+	game_time: The game time scraped this poll.
+	events: The events section after this poll.
+'''
+def concat_update(match, score, game_time, events):
+
+	match.home_team['score'], match.away_team['score'] = score
+	match.game_time = game_time
+
+	delim = ' - '
+	if (match.home_team['score'] == '') and (match.away_team['score'] == ''):
+		delim = ' vs '
+
+	header = '# ' + match.game_time + ': ' + \
+		  match.home_team['name'] + ' ' + match.home_team['flair'] + ' ' + \
+		  match.home_team['score'] + delim + match.away_team['score'] + ' ' +\
+		  match.away_team['flair'] + ' ' + match.away_team['name'] + '\n\n'
+	header += '### **Venue**: ' + match.venue + '\n\n' + \
+		  '### **Kickoff Time**: ' + match.kickoff_time + ' BST' +\
+		  '\n\n----\n\n'
+
+	return header + match.thread['lineups'] + events
+
+
+''' Render a poll's update the way Match.update_thread does: only the
+    sections that have changed are re-rendered and re-hashed, and the body
+    is joined from them.
+    Args:
+	match: A Match whose thread has been rendered.
+	score: The (home score, away score) scraped this poll.
+	game_time: The game time scraped this poll.
+	events: The events section after this poll.
+'''
+def render_update(match, score, game_time, events):
+
+	match._set_score(score, game_time)
+	match._set_section('events', events)
+	match._hash_sections()
+
+	return render.body(match.thread)
+
+
+''' Run every benchmark against the corpus, and return the results.
+    Args:
+	iterations: The number of times to run each benchmark.
+'''
+def run(iterations):
+
+	server = FixtureServer()
+	rugby_bot.r = FakeReddit()
+	rugby_bot.CALENDAR_FILE = None
+	rugby_bot.STATE_FILE = ':memory:'
+	manifest = server.manifest
+
+	# Raw parse time for every page in the corpus.
+	results = []
+	for path in sorted(manifest):
+		fname = os.path.join(FIXTURES_DIR, manifest[path])
+		with open(fname, 'rb') as fp:
+			content = fp.read()
+		result = bench('parse ' + path, lambda: html.fromstring(content),
+			       iterations)
+		result['tree_kb'] = memory(fname)
+		results.append(result)
+
+	# The scraping layer, fetching through the stand-in server.
+	scheduler = rugby_bot.Scheduler(url=server.url,
+				competitions=rugby_bot.COMPETITIONS,
+				cache_size=rugby_bot.CACHE_SIZE,
+				max_workers=rugby_bot.MAX_WORKERS,
+				match_deadline=rugby_bot.MATCH_DEADLINE,
+				edit_window=rugby_bot.EDIT_WINDOW)
+	calendar  = scheduler.calendar
+	scoreboard = rugby_bot.fetcher.fetch(server.url + '/rugby/scoreboard').tree
+	results.append(bench('CalendarIndex.parse /rugby/scoreboard',
+			     lambda: calendar.parse(scoreboard, 2017), iterations))
+	results.append(bench('CalendarIndex.prefetch',
+			     lambda: calendar.days.clear() or
+				     calendar.prefetch(datetime.today()),
+			     iterations))
+
+	for path in sorted(p for p in manifest if p.startswith('/rugby/match?')):
+		match = rugby_bot.Match(server.url + path)
+		tree  = rugby_bot.fetcher.fetch(match.url).tree
+		lineup = select_one('match.home_starters', tree)
+		names = [match.home_team['name'], match.away_team['name']]
+
+		results.append(bench('Match.setup_gamethread ' + path,
+				     match.setup_gamethread, iterations))
+		results.append(bench('Match._get_lineup ' + path,
+				     lambda: match._get_lineup(lineup), iterations))
+		results.append(bench('Match._get_events ' + path,
+				     lambda: match._get_events(tree), iterations))
+		results.append(bench('Match._get_flair ' + path,
+				     lambda: [match._get_flair(n) for n in names],
+				     iterations))
+
+		# Render the thread as it's posted, then time the updates for a run
+		# of live polls, where the score, the clock and the events change.
+		match.thread['title'] = render.title(match)
+		match._set_section('lineups', render.lineups(match))
+		match._set_section('header', render.header(match))
+		match.events.ingest(match._get_events(tree))
+		match._set_section('events', match.events.section)
+		match._hash_sections()
+		polls = live_polls(match, iterations)
+
+		concat_polls, render_polls = iter(polls), iter(polls)
+		results.append(bench('render update (concat) ' + path,
+				     lambda: concat_update(match, *next(concat_polls)),
+				     iterations))
+		results.append(bench('render update (render.py) ' + path,
+				     lambda: render_update(match, *next(render_polls)),
+				     iterations))
+
+	server.shutdown()
+	return results
+
+
+''' Print the results as a table. '''
+def report(results):
+
+	row = '{:<58} {:>9} {:>9} {:>9} {:>10} {:>9}'
+	print row.format('benchmark', 'mean ms', 'p50 ms', 'p95 ms', 'calls/s',
+			 'tree kb')
+	for result in results:
+		print row.format(result['name'][:58],
+				 '%.3f' % result['mean_ms'],
+				 '%.3f' % result['p50_ms'],
+				 '%.3f' % result['p95_ms'],
+				 '%.1f' % result['per_sec'],
+				 '%.1f' % result['tree_kb']
+				 if result['tree_kb'] is not None else '-')
+
+
+''' Fetch live pages, and add them to the corpus.
+    Args:
+	urls: The URLs of the pages to record.
+'''
+def record(urls):
+
+	manifest = load_manifest()
+	for url in urls:
+		parsed = urlparse(url)
+		path = parsed.path + ('?' + parsed.query if parsed.query else '')
+		fname = (parsed.path.strip('/').replace('/', '-') + '-' +
+			 parsed.query.replace('=', '-').replace('&', '-'))
+		fname = fname.strip('-') + '.html'
+
+		response = requests.get(url, timeout=rugby_bot.REQUEST_TIMEOUT)
+		response.raise_for_status()
+		with open(os.path.join(FIXTURES_DIR, fname), 'wb') as fp:
+			fp.write(response.content)
+
+		manifest[path] = fname
+		print 'recorded ', url, ' -> ', fname
+
+	with open(MANIFEST, 'w') as fp:
+		json.dump(manifest, fp, indent=4, sort_keys=True)
+
+
+if __name__=='__main__':
+
+	args = sys.argv[1:]
+	if args and args[0] == 'record':
+		record(args[1:])
+	elif args and args[0] == 'memory':
+		measure(args[1])
+	else:
+		iterations = ITERATIONS
+		if '--iterations' in args:
+			iterations = int(args[args.index('--iterations') + 1])
+
+		results = run(iterations)
+		if '--json' in args:
+			print json.dumps(results, indent=4)
+		else:
+			report(results)
@@ -0,0 +1,304 @@
+#
+# Calendar Index: An index of upcoming fixtures, built by prefetching a
+# window of ESPN scoreboard pages in parallel.
+#
+# ========================================================================
+
+
+import os
+import json
+
+from datetime import datetime, timedelta
+
+import dateutil.parser as date_parser
+
+from xpaths import select, select_one
+from metrics import metrics
+
+
+# The formats the scoreboard lists kick off times in. A match that's under
+# way lists something else (e.g. the game clock, "52'", or 'HT').
+KICKOFF_FORMATS = ('%H:%M', '%I:%M %p')
+
+
+''' Returns the kick off time listed on the scoreboard as a datetime (on
+    1/1/1900), or None if the match is under way or over.
+    Args:
+	text: The scoreboard's game time, e.g. '15:00'.
+'''
+def parse_kickoff(text):
+
+	for fmt in KICKOFF_FORMATS:
+		try:
+			return datetime.strptime(text.strip(), fmt)
+		except ValueError:
+			pass
+
+	return None
+
+
+'''   Holds the fixtures found on each scoreboard page in a window of days,
+      and answers 'when is the next match?' from that index rather than by
+      walking the scoreboard one day at a time. '''
+class CalendarIndex(object):
+
+	''' Create a CalendarIndex.
+	    Args:
+	    	base: The URL of the scoreboard page.
+		fetcher: The Fetcher to fetch pages with.
+		pool: The WorkerPool to fetch pages on.
+		window: The number of days to prefetch at a time.
+		max_days: The furthest ahead (in days) we'll look for a match.
+		ttl: The number of seconds a fetched day stays fresh for.
+		retry_ttl: The number of seconds before a day we failed to fetch
+			   is tried again.
+		deadline: The number of seconds a single page fetch may take.
+		path: An optional file to persist the index to.
+	'''
+	def __init__(self, base, fetcher, pool, window, max_days, ttl, retry_ttl,
+		     deadline, path=None):
+
+		self.base      = base
+		self.fetcher   = fetcher
+		self.pool      = pool
+		self.window    = window
+		self.max_days  = max_days
+		self.ttl       = ttl
+		self.retry_ttl = retry_ttl
+		self.deadline  = deadline
+		self.path      = path
+
+		# Maps a day ('YYYYMMDD') to the time it was fetched, the fixtures
+		# found on its page, and whether the fetch failed.
+		self.days = {}
+		self._load()
+
+		# When a whole window fails (e.g. ESPN is down), we don't try again
+		# until this time.
+		self.unavailable_until = datetime.min
+
+	''' Returns the first fixture in the given competition on the next day
+	    that it has any fixtures, or None if there are none within
+	    'max_days'. Fixtures that have finished are ignored. The fixture's
+	    'page' is the URL of the scoreboard page it was found on. Raises an
+	    IOError if a whole window of pages couldn't be fetched.
+	    Args:
+	    	competition: The (lower case) name of the competition.
+	'''
+	def next_match(self, competition):
+
+		if datetime.now() < self.unavailable_until:
+			raise IOError('calendar unavailable until ' +
+				      self.unavailable_until.strftime('%H:%M:%S'))
+
+		today = datetime.today()
+		for offset in range(self.max_days):
+			key = self._key(today + timedelta(days=offset))
+			if not self._is_fresh(key):
+				if not self.prefetch(today + timedelta(days=offset)):
+					self.unavailable_until = datetime.now() + \
+						timedelta(seconds=self.retry_ttl)
+					raise IOError('calendar: no scoreboard pages from ' +
+						      key + ' could be fetched')
+
+			fixtures = [
+					f for f in self.days[key]['fixtures']
+					if f['competition'] == competition
+					and f['time'].lower() != 'ft'
+			]
+			if fixtures:
+				fixture = min(fixtures, key=lambda f: f['kickoff'])
+				return dict(fixture, page=self.days[key]['url'])
+
+		return None
+
+	''' Fetch the scoreboard pages for a window of days in parallel, and
+	    add their fixtures to the index. Days that are still fresh aren't
+	    fetched again. Returns False if every page we tried failed.
+	    Args:
+	    	start: The first day of the window.
+	'''
+	def prefetch(self, start):
+
+		days = [start + timedelta(days=offset) for offset in range(self.window)]
+		days = [day for day in days if not self._is_fresh(self._key(day))]
+		jobs = [self.pool.submit(self._fetch_day, day) for day in days]
+		self.pool.wait(jobs, self.deadline)
+
+		# A day we failed to fetch is treated as having no fixtures, and is
+		# tried again after the retry TTL.
+		fetched = datetime.now()
+		failures = 0
+		for day, job in zip(days, jobs):
+			failed = not job.done.is_set() or job.error is not None
+			if failed:
+				failures += 1
+				print 'calendar error: ', self._key(day), str(job.error)
+				metrics.error('calendar', job.error or
+					      RuntimeError('deadline exceeded'))
+
+			# If a day we knew about fails, keep its fixtures until the
+			# retry.
+			key = self._key(day)
+			if failed and key in self.days:
+				self.days[key].update(fetched=fetched, failed=True)
+			else:
+				self.days[key] = {
+						'fetched': fetched,
+						'url': self.url(day),
+						'fixtures': [] if failed else job.result,
+						'failed': failed
+				}
+
+		# Days that have passed are of no more use to us.
+		today = self._key(datetime.today())
+		for key in [k for k in self.days if k < today]:
+			del self.days[key]
+
+		self._save()
+
+		return not days or failures < len(days)
+
+	''' Fetch the given scoreboard page again, and replace its day's
+	    fixtures. A page fetched before kick off doesn't show when its
+	    matches have finished.
+	    Args:
+	    	url: The URL of the scoreboard page.
+	'''
+	def refresh(self, url):
+
+		for key, entry in self.days.items():
+			if entry['url'] != url:
+				continue
+
+			day = datetime.strptime(key, '%Y%m%d')
+			try:
+				fixtures = self._fetch_day(day)
+			except Exception as exc:
+				print 'calendar error: ', key, str(exc)
+				metrics.error('calendar', exc)
+				return
+
+			self.days[key] = {
+					'fetched': datetime.now(),
+					'url': url,
+					'fixtures': fixtures,
+					'failed': False
+			}
+			self._save()
+			return
+
+	''' Returns the scoreboard URL for the given day. Today's page is the
+	    scoreboard's front page. '''
+	def url(self, day):
+
+		if day.date() == datetime.today().date():
+			return self.base
+
+		return self.base + '?date=' + self._key(day)
+
+	''' Fetch and parse the fixtures on the given day's scoreboard page. '''
+	def _fetch_day(self, day):
+
+		tree = self.fetcher.fetch(self.url(day)).tree
+		return self.parse(tree, day.year)
+
+	''' Returns a list of the fixtures on a scoreboard page, where each
+	    fixture is a dict of its competition, date, time and kick off.
+	    Args:
+	    	tree: The HTML document tree of the scoreboard page.
+		year: The year the page belongs to.
+	'''
+	def parse(self, tree, year):
+
+		fixtures = []
+		for status in select('scoreboard.status', tree):
+			date = select('scoreboard.date', status)
+			time = select('scoreboard.time', status)
+			if not (date and time):
+				continue
+
+			date = date[0].text_content()
+			time = time[0]
+			competition = select_one('scoreboard.competition', time)
+
+			# ESPN dates are formatted as 'day/month'. Matches that are
+			# under way show the game clock rather than a kick off time.
+			day, month = [int(d) for d in date.split('/')]
+			kickoff = parse_kickoff(time.text_content())
+			if kickoff:
+				kickoff = kickoff.replace(year=year, month=month, day=day)
+			else:
+				kickoff = datetime(year, month, day)
+
+			fixtures.append({
+					'competition': competition.text_content().lower(),
+					'date': date,
+					'time': time.text_content(),
+					'kickoff': kickoff
+			})
+
+		return fixtures
+
+	''' Returns True if the given day has been fetched within the TTL, or
+	    failed to fetch within the retry TTL. '''
+	def _is_fresh(self, key):
+
+		if key not in self.days:
+			return False
+
+		entry = self.days[key]
+		ttl = self.retry_ttl if entry['failed'] else self.ttl
+		return datetime.now() - entry['fetched'] < timedelta(seconds=ttl)
+
+	''' Returns the index key for the given day. '''
+	def _key(self, day):
+
+		return day.strftime('%Y%m%d')
+
+	''' Write the index to disk, if we've been given a path. We write to a
+	    temporary file first so a crash can't leave a half written index. '''
+	def _save(self):
+
+		if not self.path:
+			return
+
+		days = {}
+		for key, entry in self.days.items():
+			days[key] = {
+					'fetched': entry['fetched'].isoformat(),
+					'url': entry['url'],
+					'failed': entry['failed'],
+					'fixtures': [
+						dict(f, kickoff=f['kickoff'].isoformat())
+						for f in entry['fixtures']
+					]
+			}
+
+		with open(self.path + '.tmp', 'w') as fp:
+			json.dump(days, fp)
+		os.rename(self.path + '.tmp', self.path)
+
+	''' Load a previously saved index from disk, if there is one. '''
+	def _load(self):
+
+		if not (self.path and os.path.exists(self.path)):
+			return
+
+		try:
+			with open(self.path, 'r') as fp:
+				days = json.load(fp)
+		except ValueError as ve:
+			print 'calendar error: ', str(ve)
+			return
+
+		for key, entry in days.items():
+			self.days[key] = {
+					'fetched': date_parser.parse(entry['fetched']),
+					'url': entry['url'],
+					'failed': entry.get('failed', False),
+					'fixtures': [
+						dict(f, kickoff=date_parser.parse(f['kickoff']))
+						for f in entry['fixtures']
+					]
+			}
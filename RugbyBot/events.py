@@ -0,0 +1,106 @@
+#
+# Events: Incremental store for a match's commentary events.
+#
+# ========================================================================
+
+
+EVENT_FLAIRS = {
+		'red card': '[](#red)',
+		'yellow card': '[](#yellow)',
+		'substitute': '[](#sub)', 'substituted': '[](#sub)',
+		'try': '[](#try)',
+		'conversion': '[](#conv)',
+		'penalty': '[](#pen)',
+		'drop': '[](#drop)'
+}
+
+KEY_EVENTS = ['red card', 'yellow card', 'try', 'conversion', 'penalty']
+
+EVENTS_HEADER = "## **Match Events**:\n"
+
+
+'''   Holds every event we've seen for a match, along with its rendered
+      markdown. ESPN lists events newest first and only ever adds to the top
+      of the table, so each update we only parse and render the rows above
+      the last event we already have. '''
+class EventLog(object):
+
+	def __init__(self):
+
+		self.reset()
+
+	''' Forget every event we've seen. '''
+	def reset(self):
+
+		self.events  = []
+		self.section = EVENTS_HEADER
+		self.is_over = False
+
+	''' Restore previously saved events, along with their rendered section.
+	    Args:
+	    	events: A list of (minute, text) events, oldest first.
+		section: The rendered events section.
+		is_over: Whether the end of the match has been seen.
+	'''
+	def restore(self, events, section, is_over):
+
+		self.events  = [tuple(event) for event in events]
+		self.section = section
+		self.is_over = is_over
+
+	''' Add any new events from the commentary table, and return the number
+	    of events added.
+	    Args:
+	    	rows: The rows of the commentary table, newest first.
+	'''
+	def ingest(self, rows):
+
+		n_new = len(rows) - len(self.events)
+
+		# If the rows below the new ones don't line up with what we have
+		# then ESPN has edited the table, and we'll need to start over.
+		if n_new < 0 or (self.events and
+				 self._parse(rows[n_new]) != self.events[-1]):
+			self.reset()
+			n_new = len(rows)
+
+		new = [self._parse(row) for row in rows[:n_new]][::-1]
+		self.section += ''.join(self._render(event) for event in new)
+		self.events.extend(new)
+
+		return len(new)
+
+	''' Returns an event as a (minute, text) tuple.
+	    Args:
+	    	row: A row from the commentary table.
+	'''
+	def _parse(self, row):
+
+		event = row.text_content().split("'")
+		return (event[0], event[1])
+
+	''' Returns the markdown for a single event. Any event that is flaired
+	    is prefixed with its flair, and key events are bolded.
+	    Args:
+	    	event: A (minute, text) tuple.
+	'''
+	def _render(self, event):
+
+		minute, text = event
+		if text.lower().find('end of second half') != -1:
+			self.is_over = True
+
+		# Check for a flair.
+		flair = [
+				f for f in EVENT_FLAIRS.keys()
+				if text.lower().find(f) != -1
+		]
+
+		# Prepend the flair markdown. Bold the event if necessary.
+		if flair:
+			if flair[0] in KEY_EVENTS:
+				text = '**' + text + '**'
+
+			text = EVENT_FLAIRS[flair[0]] + ' ' + text
+
+		return '\n\n**' + minute + "'**  " + text
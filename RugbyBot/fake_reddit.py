@@ -0,0 +1,133 @@
+#
+# Fake Reddit: An offline stand-in for praw.Reddit, for running the bot
+# (or the benchmark) without touching Reddit.
+#
+#	rugby_bot.r = FakeReddit(fail_rate=0.1, rate_limit=10)
+#
+# Every submission and edit is recorded. Writes can be made to fail at
+# random, or to be rate limited, to exercise the writer's retries.
+#
+# ========================================================================
+
+
+import time
+import random
+import threading
+import itertools
+
+
+'''   Stands in for the response on a prawcore ResponseException. '''
+class FakeResponse(object):
+
+	def __init__(self, status_code, headers):
+
+		self.status_code = status_code
+		self.headers	 = headers
+
+
+'''   Raised by a write that's been rate limited, like a prawcore
+      ResponseException for an HTTP 429. '''
+class RateLimited(Exception):
+
+	def __init__(self, retry_after):
+
+		Exception.__init__(self, 'received 429 HTTP response')
+		self.response = FakeResponse(429, {'retry-after': str(retry_after)})
+
+
+'''   Raised by a write that's been made to fail. '''
+class WriteFailed(Exception):
+	pass
+
+
+'''   Stands in for a praw.models.Submission. '''
+class FakeSubmission(object):
+
+	def __init__(self, reddit, id, title=None, selftext=''):
+
+		self.reddit   = reddit
+		self.id	      = id
+		self.title    = title
+		self.selftext = selftext
+		self.edits    = 0
+
+	''' Replace the submission's body, and return the submission. '''
+	def edit(self, body):
+
+		self.reddit._write('edit', self.id)
+		self.selftext = body
+		self.edits += 1
+		return self
+
+
+'''   Stands in for a praw.models.Subreddit. '''
+class FakeSubreddit(object):
+
+	def __init__(self, reddit, name):
+
+		self.reddit = reddit
+		self.name   = name
+
+	''' Create a submission, and return it. '''
+	def submit(self, title, selftext):
+
+		self.reddit._write('submit', self.name)
+		submission = FakeSubmission(self.reddit,
+					    str(next(self.reddit.ids)), title,
+					    selftext)
+		self.reddit.submissions[submission.id] = submission
+		return submission
+
+
+'''   Stands in for praw.Reddit. '''
+class FakeReddit(object):
+
+	''' Create a FakeReddit.
+	    Args:
+	    	latency: The number of seconds each write takes.
+		fail_rate: The fraction of writes that fail.
+		rate_limit: The number of writes allowed per minute, or None for
+			    no limit.
+	'''
+	def __init__(self, latency=0, fail_rate=0, rate_limit=None):
+
+		self.latency	 = latency
+		self.fail_rate	 = fail_rate
+		self.rate_limit	 = rate_limit
+
+		self.submissions = {}
+		self.ids	 = itertools.count(1)
+		self.lock	 = threading.Lock()
+
+		# Every write attempted, as (time, kind, target, outcome).
+		self.writes	 = []
+
+	def subreddit(self, name):
+
+		return FakeSubreddit(self, name)
+
+	def submission(self, id):
+
+		if id not in self.submissions:
+			self.submissions[id] = FakeSubmission(self, id)
+		return self.submissions[id]
+
+	''' Record a write, raising if it's rate limited or made to fail. '''
+	def _write(self, kind, target):
+
+		time.sleep(self.latency)
+
+		with self.lock:
+			now = time.time()
+			if self.rate_limit is not None:
+				recent = [w for w in self.writes
+					  if w[3] == 'ok' and now - w[0] < 60]
+				if len(recent) >= self.rate_limit:
+					self.writes.append((now, kind, target, 'limited'))
+					raise RateLimited(60 - (now - recent[0][0]))
+
+			if random.random() < self.fail_rate:
+				self.writes.append((now, kind, target, 'failed'))
+				raise WriteFailed(kind + ' failed: ' + target)
+
+			self.writes.append((now, kind, target, 'ok'))
@@ -0,0 +1,156 @@
+#
+# Fetcher: The single HTTP layer used for every ESPN page the bot reads.
+#
+# ========================================================================
+
+
+import threading
+
+from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from lxml import html
+
+from collections import OrderedDict
+
+from metrics import metrics
+
+
+'''   A fetched and parsed page. 'changed' is False when the server told us
+      the page is the same as the last time we fetched it, in which case
+      'tree' is the tree we parsed back then. '''
+class Page(object):
+
+	def __init__(self, url, tree, changed):
+
+		self.url     = url
+		self.tree    = tree
+		self.changed = changed
+
+
+'''   Fetches pages over a pooled, keep-alive session. Every page is cached
+      along with its ETag / Last-Modified validators, so a re-fetch of an
+      unchanged page costs a 304 and neither a download nor a re-parse. '''
+class Fetcher(object):
+
+	''' Create a Fetcher.
+	    Args:
+	    	pool_size: The number of connections to keep open per host.
+		timeout: The number of seconds to wait on a request.
+		cache_size: The number of parsed pages to keep for revalidation.
+	'''
+	def __init__(self, pool_size, timeout, cache_size=64):
+
+		self.timeout	= timeout
+		self.cache_size = cache_size
+		self.cache	= OrderedDict()
+		self.lock	= threading.Lock()
+
+		# While a poll cycle is running, every page is fetched and parsed at
+		# most once, and the same Page is handed to everyone who asks.
+		self.snapshot	= None
+
+		adapter = HTTPAdapter(pool_connections=pool_size,
+				      pool_maxsize=pool_size)
+		self.session = requests.Session()
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+		self.session.headers.update({
+				'Accept-Encoding': 'gzip, deflate',
+				'Connection': 'keep-alive'
+		})
+
+	''' Start a poll cycle. Until end_cycle() is called, each URL is only
+	    fetched once. '''
+	def begin_cycle(self):
+
+		with self.lock:
+			self.snapshot = {}
+
+	''' End the poll cycle, so that the next fetch of any page goes back to
+	    the server. '''
+	def end_cycle(self):
+
+		with self.lock:
+			self.snapshot = None
+
+	''' Return a Page for the given URL. During a poll cycle this is the
+	    cycle's snapshot of the page, otherwise the page is revalidated
+	    against our cached copy (if we have one).
+	    Args:
+	    	url: The URL of the page.
+	'''
+	def fetch(self, url):
+
+		with self.lock:
+			snapshot = self.snapshot
+			if snapshot is not None:
+				entry = snapshot.setdefault(url, {
+						'lock': threading.Lock(),
+						'page': None
+				})
+
+		if snapshot is None:
+			return self._fetch(url)
+
+		# Anyone else asking for the page while it's being fetched waits
+		# for it, rather than fetching it again.
+		with entry['lock']:
+			if entry['page'] is None:
+				entry['page'] = self._fetch(url)
+			return entry['page']
+
+	''' Fetch and parse the page at the given URL. '''
+	def _fetch(self, url):
+
+		with self.lock:
+			cached = self.cache.get(url)
+
+		# Ask the server to only send the page if it has changed.
+		headers = {}
+		if cached:
+			if cached['etag']:
+				headers['If-None-Match'] = cached['etag']
+			if cached['last_modified']:
+				headers['If-Modified-Since'] = cached['last_modified']
+
+		# Pages are timed by type, e.g. 'scoreboard', 'match'.
+		page = urlparse(url).path.rstrip('/').split('/')[-1] or 'other'
+		try:
+			with metrics.timer('rugby_fetch_seconds', page=page):
+				response = self.session.get(url, headers=headers,
+							    timeout=self.timeout)
+		except Exception as exc:
+			metrics.error('fetch', exc)
+			raise
+
+		metrics.inc('rugby_fetch_total', page=page,
+			    status=str(response.status_code))
+		if response.status_code == 304 and cached:
+			return Page(url, cached['tree'], changed=False)
+
+		with metrics.timer('rugby_parse_seconds', page=page):
+			tree = html.fromstring(response.content)
+
+		# Only successful responses with validators are worth keeping.
+		etag	      = response.headers.get('ETag')
+		last_modified = response.headers.get('Last-Modified')
+		if response.status_code == 200 and (etag or last_modified):
+			self._store(url, {
+					'etag': etag,
+					'last_modified': last_modified,
+					'tree': tree
+			})
+
+		return Page(url, tree, changed=True)
+
+	''' Add a page to the cache, evicting the least recently stored one
+	    if we're full. '''
+	def _store(self, url, entry):
+
+		with self.lock:
+			self.cache.pop(url, None)
+			self.cache[url] = entry
+			while len(self.cache) > self.cache_size:
+				self.cache.popitem(last=False)
@@ -0,0 +1,95 @@
+#
+# Flair Index: Resolves ESPN team names to their subreddit flairs.
+#
+# The flairs live in flairs.json, grouped by league. Each entry maps a team
+# name (lower case, words joined by '-') to the flair it's shown with. A
+# team can be listed under more than one name to give it aliases.
+#
+# ========================================================================
+
+
+import os
+import json
+import threading
+
+
+FLAIR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+			  'flairs.json')
+
+
+'''   An index of every team's flair, built once when the bot starts. Team
+      names are looked up by their normalized name, then by the words in
+      it, and every name we resolve is remembered. '''
+class FlairIndex(object):
+
+	''' Create a FlairIndex.
+	    Args:
+	    	path: The path of the flair data file.
+	'''
+	def __init__(self, path=FLAIR_FILE):
+
+		with open(path, 'r') as fp:
+			leagues = json.load(fp)
+
+		# Maps a team's name to its flair, and each word in a team's name
+		# to the names it appears in. Names are indexed in sorted order, so
+		# a word shared by several teams always resolves the same way.
+		self.teams  = {}
+		self.tokens = {}
+		self.names  = []
+		for league in sorted(leagues):
+			for name, flair in sorted(leagues[league].items()):
+				self.teams[name] = flair
+				self.names.append(name)
+				for token in name.split('-'):
+					self.tokens.setdefault(token, []).append(name)
+
+		self.memo = {}
+		self.lock = threading.Lock()
+
+	''' Returns the flair markdown for the given team, or an empty string if
+	    we don't know the team.
+	    Args:
+	    	name: The name of the team, as ESPN lists it.
+	'''
+	def resolve(self, name):
+
+		with self.lock:
+			if name in self.memo:
+				return self.memo[name]
+
+		team = self._find(name)
+		flair = '[](#' + self.teams[team] + ')' if team else ''
+
+		with self.lock:
+			self.memo[name] = flair
+
+		return flair
+
+	''' Returns the name of the indexed team that best matches the given
+	    name, or None if nothing does. '''
+	def _find(self, name):
+
+		# Reformat name.
+		tokens = name.lower().split()
+		name = '-'.join(tokens)
+
+		# Check for exact matches (e.g. 'La Rochelle' is 'larochelle').
+		if name in self.teams:
+			return name
+		if len(tokens) > 1 and (tokens[0] + tokens[1]) in self.teams:
+			return tokens[0] + tokens[1]
+
+		# Otherwise, go by the longest word that names any team. A word
+		# that only appears within a team's name (e.g. 'rochelle' in
+		# 'larochelle') is a last resort.
+		for token in sorted(tokens, key=len, reverse=True):
+			if token in self.tokens:
+				return self.tokens[token][0]
+
+		for token in sorted(tokens, key=len, reverse=True):
+			for team in self.names:
+				if token in team:
+					return team
+
+		return None
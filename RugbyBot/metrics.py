@@ -0,0 +1,238 @@
+#
+# Metrics: Counters, gauges and timers for the bot, exposed as Prometheus
+# text over HTTP and as a JSON dump.
+#
+#	curl http://127.0.0.1:9108/metrics
+#	curl http://127.0.0.1:9108/metrics.json
+#
+# Every module records into the shared 'metrics' instance at the bottom of
+# this file. Metrics are keyed by name and labels, e.g.
+#
+#	metrics.inc('rugby_edits_total', result='pushed')
+#	with metrics.timer('rugby_fetch_seconds', page='match'): ...
+#
+# ========================================================================
+
+
+import os
+import json
+import time
+import threading
+
+import BaseHTTPServer
+import SocketServer
+
+from contextlib import contextmanager
+
+
+# The upper bounds (in seconds) of the timer histogram buckets.
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+'''   A histogram of how long something took. '''
+class Timer(object):
+
+	def __init__(self, buckets):
+
+		self.buckets = buckets
+		self.counts  = [0] * len(buckets)
+		self.count   = 0
+		self.total   = 0.0
+		self.max     = 0.0
+
+	''' Record a duration, in seconds. '''
+	def observe(self, seconds):
+
+		self.count += 1
+		self.total += seconds
+		self.max = max(self.max, seconds)
+		for i, bound in enumerate(self.buckets):
+			if seconds <= bound:
+				self.counts[i] += 1
+
+
+'''   Holds every metric the bot records. Safe to use from any thread. '''
+class Metrics(object):
+
+	''' Create a Metrics registry.
+	    Args:
+	    	buckets: The histogram bucket bounds used by every timer.
+	'''
+	def __init__(self, buckets=BUCKETS):
+
+		self.buckets  = buckets
+		self.lock     = threading.Lock()
+		self.counters = {}
+		self.gauges   = {}
+		self.timers   = {}
+
+	''' Add n to a counter. '''
+	def inc(self, name, n=1, **labels):
+
+		key = _key(name, labels)
+		with self.lock:
+			self.counters[key] = self.counters.get(key, 0) + n
+
+	''' Set a gauge to the given value. '''
+	def set(self, name, value, **labels):
+
+		with self.lock:
+			self.gauges[_key(name, labels)] = value
+
+	''' Record a duration (in seconds) on a timer. '''
+	def observe(self, name, seconds, **labels):
+
+		key = _key(name, labels)
+		with self.lock:
+			if key not in self.timers:
+				self.timers[key] = Timer(self.buckets)
+			self.timers[key].observe(seconds)
+
+	''' Time the enclosed block, recording it on the named timer whether or
+	    not it raises. '''
+	@contextmanager
+	def timer(self, name, **labels):
+
+		start = time.time()
+		try:
+			yield
+		finally:
+			self.observe(name, time.time() - start, **labels)
+
+	''' Record an error, labelled with where it happened and the type of
+	    the exception. '''
+	def error(self, source, exc):
+
+		self.inc('rugby_errors_total', source=source,
+			 cause=type(exc).__name__)
+
+	''' Returns every metric as a JSON serializable dict. '''
+	def snapshot(self):
+
+		with self.lock:
+			return {
+					'time': time.time(),
+					'counters': [_entry(k, v) for k, v in
+						     sorted(self.counters.items())],
+					'gauges': [_entry(k, v) for k, v in
+						   sorted(self.gauges.items())],
+					'timers': [_entry(k, {
+							'count': t.count,
+							'sum': t.total,
+							'max': t.max,
+							'mean': t.total / t.count
+					}) for k, t in sorted(self.timers.items())]
+			}
+
+	''' Returns every metric in the Prometheus text exposition format. '''
+	def render(self):
+
+		lines = []
+		with self.lock:
+			for kind, metrics in (('counter', self.counters),
+					      ('gauge', self.gauges)):
+				for name in sorted(set(k[0] for k in metrics)):
+					lines.append('# TYPE ' + name + ' ' + kind)
+					for key in sorted(k for k in metrics if k[0] == name):
+						lines.append(name + _labels(key[1]) + ' ' +
+							     repr(metrics[key]))
+
+			for name in sorted(set(k[0] for k in self.timers)):
+				lines.append('# TYPE ' + name + ' histogram')
+				for key in sorted(k for k in self.timers if k[0] == name):
+					timer = self.timers[key]
+					for bound, count in zip(timer.buckets, timer.counts):
+						lines.append(name + '_bucket' +
+							     _labels(key[1], le=repr(bound)) +
+							     ' ' + str(count))
+					lines.append(name + '_bucket' +
+						     _labels(key[1], le='+Inf') + ' ' +
+						     str(timer.count))
+					lines.append(name + '_sum' + _labels(key[1]) + ' ' +
+						     repr(timer.total))
+					lines.append(name + '_count' + _labels(key[1]) + ' ' +
+						     str(timer.count))
+
+		return '\n'.join(lines) + '\n'
+
+	''' Write a snapshot of every metric to the given file. We write to a
+	    temporary file first so a reader never sees a half written dump. '''
+	def dump(self, path):
+
+		with open(path + '.tmp', 'w') as fp:
+			json.dump(self.snapshot(), fp, indent=4)
+		os.rename(path + '.tmp', path)
+
+
+''' Returns the registry key for a metric name and its labels. '''
+def _key(name, labels):
+
+	return (name, tuple(sorted(labels.items())))
+
+
+''' Returns a metric as a dict of its name, labels and value. '''
+def _entry(key, value):
+
+	return {'name': key[0], 'labels': dict(key[1]), 'value': value}
+
+
+''' Returns the Prometheus label string for the given labels. '''
+def _labels(labels, **extra):
+
+	labels = list(labels) + sorted(extra.items())
+	if not labels:
+		return ''
+
+	return '{' + ','.join('%s="%s"' % (k, str(v).replace('"', '\\"'))
+			      for k, v in labels) + '}'
+
+
+'''   Serves the metrics: Prometheus text at /metrics, and JSON at
+      /metrics.json. '''
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+	def do_GET(self):
+
+		if self.path == '/metrics':
+			body = self.server.metrics.render()
+			content_type = 'text/plain; version=0.0.4'
+		elif self.path == '/metrics.json':
+			body = json.dumps(self.server.metrics.snapshot(), indent=4)
+			content_type = 'application/json'
+		else:
+			self.send_error(404)
+			return
+
+		self.send_response(200)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	# Keep the bot's output readable.
+	def log_message(self, *args):
+		pass
+
+
+class MetricsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+	daemon_threads = True
+
+	''' Start serving the metrics in the background.
+	    Args:
+	    	port: The local port to serve on.
+		metrics: The Metrics to serve.
+	'''
+	def __init__(self, port, metrics):
+
+		BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port),
+						   MetricsHandler)
+		self.metrics = metrics
+
+		thread = threading.Thread(target=self.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+
+# Every module records into this one registry.
+metrics = Metrics()
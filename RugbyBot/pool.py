@@ -0,0 +1,109 @@
+#
+# Worker Pool: A small, bounded thread pool used to run match updates (and
+# any other network bound work) concurrently.
+#
+# ========================================================================
+
+
+import threading
+import time
+
+from Queue import Queue
+
+
+'''   A unit of work submitted to the pool. Holds the result (or the error) of
+      the call once it has completed. '''
+class Job(object):
+
+	''' Create a Job.
+	    Args:
+	    	fn: The callable to run.
+		args: The positional arguments to call it with.
+	'''
+	def __init__(self, fn, args):
+
+		self.fn   = fn
+		self.args = args
+
+		self.result  = None
+		self.error   = None
+		self.started = None
+		self.late    = False
+		self.done    = threading.Event()
+
+	''' Run the job, capturing either its result or the exception raised. '''
+	def run(self):
+
+		self.started = time.time()
+		try:
+			self.result = self.fn(*self.args)
+		except Exception as exc:
+			self.error = exc
+		finally:
+			self.done.set()
+
+	''' Returns True if the job has been running for longer than the given
+	    deadline (in seconds). Jobs still waiting in the queue are never late.
+	'''
+	def is_overdue(self, deadline):
+
+		if self.started is None or self.done.is_set():
+			return False
+		return (time.time() - self.started) > deadline
+
+
+'''   A fixed number of daemon worker threads pulling jobs from a shared queue.
+      The number of workers caps how many jobs run at the same time. '''
+class WorkerPool(object):
+
+	''' Create a pool.
+	    Args:
+	    	max_workers: The maximum number of jobs to run concurrently.
+	'''
+	def __init__(self, max_workers):
+
+		self.max_workers = max_workers
+		self.queue	 = Queue()
+
+		for _ in range(max_workers):
+			worker = threading.Thread(target=self._work)
+			worker.daemon = True
+			worker.start()
+
+	''' Queue a call to fn(*args), and return its Job. '''
+	def submit(self, fn, *args):
+
+		job = Job(fn, args)
+		self.queue.put(job)
+		return job
+
+	''' Block until every job in 'jobs' has either finished or run past its
+	    deadline. Overdue jobs are flagged as late and left to finish in the
+	    background -- we can't kill a thread, but we don't have to wait on it.
+	    Args:
+	    	jobs: A list of Jobs returned by submit().
+		deadline: The number of seconds each job is allowed to run for.
+	'''
+	def wait(self, jobs, deadline):
+
+		pending = list(jobs)
+		while pending:
+			for job in pending[:]:
+				if job.done.is_set():
+					pending.remove(job)
+				elif job.is_overdue(deadline):
+					job.late = True
+					pending.remove(job)
+
+			if pending:
+				pending[0].done.wait(0.1)
+
+		return jobs
+
+	''' Run jobs until the process exits. '''
+	def _work(self):
+
+		while True:
+			job = self.queue.get()
+			job.run()
+			self.queue.task_done()
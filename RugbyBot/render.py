@@ -0,0 +1,105 @@
+#
+# Render: Builds the markdown sections of a match thread.
+#
+# A thread body is made up of three sections: the 'header' (score, clock,
+# venue and kick off), the 'lineups' and the 'events'. The title and the
+# lineups never change once a thread is posted, so they're rendered once.
+# The header is re-rendered only when the score or the clock moves, and
+# the events section is kept up to date by the match's EventLog.
+#
+# ========================================================================
+
+
+import dateutil.parser as date_parser
+
+
+# The order the sections appear in the thread body.
+SECTIONS = ('header', 'lineups', 'events')
+
+# Each region's offset (in hours) from BST.
+TIMEZONES = [('BST', 0), ('NZ', 11), ('AU', 9), ('SA', 1), ('EST', -5)]
+
+# Kick off times are shared by every match in a round, so each one is only
+# ever formatted once.
+_timezones = {}
+
+
+''' Returns the thread title for the given match. '''
+def title(match):
+
+	return ''.join([
+			'Match Thread: ', match.home_team['name'], ' vs ',
+			match.away_team['name'], ' [', match.competition, '] ',
+			timezones(match.kickoff_time)
+	])
+
+
+''' Returns the given kick off time formatted in each of our timezones.
+    Args:
+	kickoff_time: The kick off time (BST), as listed on the match page.
+'''
+def timezones(kickoff_time):
+
+	if kickoff_time not in _timezones:
+		bst = date_parser.parse(kickoff_time)
+		_timezones[kickoff_time] = ', '.join([
+				'%02d:%02d %s' % ((bst.hour + offset) % 24, bst.minute, region)
+				for region, offset in TIMEZONES
+		])
+
+	return _timezones[kickoff_time]
+
+
+''' Returns the thread header for the given match. '''
+def header(match):
+
+	home, away = match.home_team, match.away_team
+
+	# If the game is active then we'll use a different delimiter.
+	delim = ' - '
+	if (home['score'] == '') and (away['score'] == ''):
+		delim = ' vs '
+
+	return ''.join([
+			# Format the team names with their respective flairs and scores.
+			'# ', match.game_time, ': ',
+			home['name'], ' ', home['flair'], ' ', home['score'], delim,
+			away['score'], ' ', away['flair'], ' ', away['name'], '\n\n',
+
+			# Format venue and kickoff time.
+			'### **Venue**: ', match.venue, '\n\n',
+			'### **Kickoff Time**: ', match.kickoff_time, ' BST',
+			'\n\n----\n\n'
+	])
+
+
+''' Returns the lineups section for the given match: starters, then
+    replacements. '''
+def lineups(match):
+
+	home, away = match.home_team, match.away_team
+	heading = ''.join(['**', home['name'], '** | **Position** | **',
+			   away['name'], '**\n', ':-|:-|:-\n'])
+
+	lines = ['## **Starting Lineups**:\n\n', heading]
+	for h_player, a_player in zip(home['starters'], away['starters']):
+		lines.extend([str(h_player[0]), '.  ', h_player[1], ' | ',
+			      h_player[2], ' | ', str(a_player[0]), '.   ',
+			      a_player[1], '\n'])
+
+	lines.extend(['\n## **Replacements**:\n', heading])
+	for h_sub, a_sub in zip(home['subs'], away['subs']):
+		lines.extend([str(h_sub[0]), '.   ', h_sub[1], ' | ', h_sub[2],
+			      ' | ', str(a_sub[0]), '.   ', a_sub[1], '\n'])
+
+	lines.append('\n\n----\n\n')
+	return ''.join(lines)
+
+
+''' Returns the thread body, made up of the given rendered sections.
+    Args:
+	sections: A dict mapping section names to their markdown.
+'''
+def body(sections):
+
+	return ''.join([sections.get(section, '') for section in SECTIONS])
@@ -5,11 +5,12 @@
 
 
 import praw
-
 import requests
-from lxml import html
 
 import time
+import heapq
+import hashlib
+import itertools
 
 from datetime import datetime, timedelta
 
@@ -19,6 +20,17 @@ import dateutil.parser as date_parser
 from operator import itemgetter
 from collections import deque
 
+from pool import WorkerPool
+from fetcher import Fetcher
+from events import EventLog, EVENTS_HEADER
+from xpaths import select, select_one
+import render
+from calendar_index import CalendarIndex, parse_kickoff
+from flair_index import FlairIndex
+from state import StateStore
+from metrics import metrics, MetricsServer
+from writer import RedditWriter, PRIORITY_POST, PRIORITY_FINAL, PRIORITY_EDIT
+
 
 '''   Responsible for getting any rugby matches scheduled, and creating threads
       when necessary. '''
@@ -26,136 +38,262 @@ class Scheduler(object):
 
 	''' Create a scheduler.
 	    Args:
-	    	subreddit_name: The name of the target subreddit.
+	    	competitions: A list of the competitions to track. Each one is a
+			      dict of the competition's (lower case) 'name', the
+			      'subreddit' to post its threads to, and 'hours_before'
+			      kick off to post them.
 	    	cache_size: The size of our match cache.
 		*url: The URL to get the match data from.
+		max_workers: The number of matches to update concurrently.
+		match_deadline: The number of seconds a single match update may
+				take before the cycle stops waiting on it.
+		edit_window: The minimum number of seconds between two edits
+			     of the same match thread.
 	'''
-	def __init__(self, url, subreddit_name, cache_size, hours_before):
+	def __init__(self, url, competitions, cache_size, max_workers,
+		     match_deadline, edit_window):
 		
 		self.base_url 	   = url
 		self.url 	   = self.base_url + '/rugby/scoreboard'
 		self.base 	   = self.base_url + '/rugby/scoreboard'
-		self.target_sub	   = r.subreddit(subreddit_name)
  		
-		self.date	   = datetime.today()
 		self.cache	   = deque(maxlen=cache_size)
-		self.hours_before  = hours_before
 
-	''' Wrapper for _run_scheduler(). Runs the scheduler and polls according
-	    to the given polling interval.
+		# Every competition shares the same scoreboard pages. Fixtures are
+		# routed to their competition by the scoreboard's headings.
+		self.competitions  = {}
+		for competition in competitions:
+			self.competitions[competition['name']] = {
+				'target_sub': r.subreddit(competition['subreddit']),
+				'hours_before': competition['hours_before']
+			}
+
+		# Match updates are run on a bounded pool. Any update that overruns
+		# its deadline stays 'in flight' until it finishes, and the match
+		# is skipped until then.
+		self.pool	   = WorkerPool(max_workers)
+		self.deadline	   = match_deadline
+		self.in_flight	   = {}
+
+		self.edit_window   = edit_window
+
+		# Upcoming fixtures are found by prefetching a window of scoreboard
+		# pages in parallel, rather than walking them one day at a time.
+		self.calendar	   = CalendarIndex(self.base, fetcher, self.pool,
+						   window=CALENDAR_WINDOW,
+						   max_days=CALENDAR_MAX_DAYS,
+						   ttl=CALENDAR_TTL,
+						   retry_ttl=CALENDAR_RETRY_TTL,
+						   deadline=match_deadline,
+						   path=CALENDAR_FILE)
+
+		# Matches are saved after every action, so that a restart can pick
+		# up where we left off.
+		self.state	   = StateStore(STATE_FILE)
+		writer.on_written  = lambda match: self.state.save([match])
+
+		# Every pending action is kept in a heap of (deadline, seq, match).
+		# A match of None is a scoreboard check for new matches.
+		self.deadlines	   = []
+		self.seq	   = itertools.count()
+
+	''' Wrapper for _run_scheduler(). Runs the scheduler, waking only when the
+	    earliest pending action is due.
 	    Args:
-	    	poll_interval: The interval between polls.
+	    	poll_interval: The interval between polls of a live match.
 	'''
 	def run_scheduler(self, poll_interval):
-		
-		# We run in intervals. Sleep until the first match, then run until
-		# all matches have completed. Then sleep again until midnight & repeat.
+
+		self.poll_interval = poll_interval
+		self._restore()
+		self._schedule(time.time(), None)
+
 		while True:
-		        interval = self._get_interval()
+			wait = self.deadlines[0][0] - time.time()
+			if wait > 0:
+				time.sleep(wait)
+				continue
+
+			# Pop everything that's due, and run it. Every page is fetched
+			# at most once per cycle, however many actions need it.
+			due = []
+			while self.deadlines and self.deadlines[0][0] <= time.time():
+				due.append(heapq.heappop(self.deadlines)[2])
+
+			start = time.time()
+			fetcher.begin_cycle()
+			if None in due:
+				due.remove(None)
+				self._schedule(self._try_discover(), None)
+
+			try:
+				self._run_scheduler(due)
+			except Exception as exc:
+				print str(exc)
+				metrics.error('scheduler', exc)
+			fetcher.end_cycle()
+
+			# Record how long the cycle took, so that slow ones stand out.
+			duration = time.time() - start
+			metrics.observe('rugby_cycle_seconds', duration)
+			metrics.set('rugby_cycle_last_seconds', duration)
+			metrics.set('rugby_cycle_matches', len(due))
+			metrics.set('rugby_matches_tracked', len(self.cache))
+			metrics.set('rugby_writes_queued', len(writer.queue))
+			if METRICS_FILE:
+				metrics.dump(METRICS_FILE)
+
+			# Work out when each match next needs our attention.
+			for match in due:
+				if match in self.cache:
+					self._schedule(self._next_deadline(match), match)
+
+	''' Reload any unfinished matches saved by a previous run, without
+	    re-scraping their match pages. '''
+	def _restore(self):
+
+		for state in self.state.load():
+			competition = self.competitions.get(state['competition_key'])
+			if competition is None:
+				continue
+
+			match = Match(state['url'], state['competition_key'],
+				      edit_window=self.edit_window, state=state)
+			if state['submission_id']:
+				match.post = r.submission(id=state['submission_id'])
+
+			print 'restored ', match.url
+			self.cache.append(match)
+			self._schedule(self._next_deadline(match), match)
+
+	''' Add an action to the heap.
+	    Args:
+	    	deadline: The time (in seconds since the epoch) it is due.
+		match: The Match to run, or None to check for new matches.
+	'''
+	def _schedule(self, deadline, match):
+
+		heapq.heappush(self.deadlines, (deadline, next(self.seq), match))
+
+	''' Check for new matches, and return the time at which to check
+	    again. Discovery is always rescheduled, even if it fails. '''
+	def _try_discover(self):
+
+		try:
+			with metrics.timer('rugby_discovery_seconds'):
+				return self._discover()
+		except Exception as exc:
+			print 'discovery error: ', str(exc)
+			metrics.error('discovery', exc)
+			return time.time() + self.poll_interval
+
+	''' Check the scoreboard. If the next match day's posting window has
+	    opened, then add any new matches to the cache. Returns the time at
+	    which the scoreboard should next be checked. '''
+	def _discover(self):
+
+		interval = self._get_interval()
+		if interval is None:
+			print 'no matches in the next ', CALENDAR_MAX_DAYS, ' days.'
+			return time.time() + DISCOVERY_INTERVAL
+
+		interval_seconds = self._seconds(interval)
+		if interval_seconds > 0:
 			print 'sleeping for ', interval.days, ' days, ',\
 				interval.hours, ' hours and ',\
 				interval.minutes, ' minutes.'
-			
-			# Determine the number of seconds until the next game, and
-			# sleep for them.
-			interval_seconds = (((interval.days * 24) * 60) * 60) +\
-					   ((interval.hours * 60) * 60) +\
-					   (interval.minutes * 60) +\
-					   (interval.seconds)
-			time.sleep(interval_seconds)
-                        
-                        # Get the matches, and run the scheduler on them.
-                        while not self.cache:
-                            try:
-                                self.cache = self._get_matches()
-                            except IndexError as ie:
-                                print str(ie)
-                                time.sleep(POLL_INTERVAL)
-			while self.cache:
-				try:
-				    self._run_scheduler()
-				except Exception as exc:
-				    print str(exc)
-				
-				time.sleep(POLL_INTERVAL)
-        
-	''' Get the time interval between today and the next match date. '''
-        def _get_interval(self):
-
-            # Attempt to find the next match date. If no matches are found on the
-            # given URL, then we'll need to iteratively search the next valid URL/s.
-            n_match_date = None
-            while not n_match_date:
-                    n_match_date = self._next_match_date()
-                    if not n_match_date:
-                            self.url = self._get_next_url()
-
-            # Return the time interval until our next match.
-            return self._get_time_until(n_match_date)
-
-	''' Return the next match date from the scheduler's current URL.
-	    Note, this looks awfully similar to _get_matches(). Unfortunately,
-	    the ESPN page doesn't load all of the necessary data to initialize
-	    a Match object until a little before the match starts, so we have no
-	    choice but to duplicate some code unless we want to refactor a lot. 
-	    Maybe something for the future. '''
-        def _next_match_date(self):
-		
-		request = requests.get(self.url)
-		tree = html.fromstring(request.content)
-		
-		# Ensure that the competitions we're looking for have matches.
-		comps = tree.xpath("//*[@class='date-heading js-show']")
-		if not any(comp.text_content().lower() == 'super rugby' for comp in comps):
+			return time.time() + interval_seconds
+
+		# Get the matches, and schedule each of them.
+		try:
+			matches = self._get_matches()
+		except IndexError as ie:
+			print str(ie)
+			metrics.error('discovery', ie)
+			return time.time() + self.poll_interval
+
+		for match in matches:
+			self.cache.append(match)
+			self._schedule(self._next_deadline(match), match)
+		self.state.save(matches)
+
+		# ESPN may not have filled in the match pages yet, so keep trying.
+		# Or the calendar's copy of the page may be out of date (e.g. its
+		# matches have since finished), so bring it up to date. The page
+		# has already been fetched this cycle, so this costs no request.
+		if not self.cache:
+			self.calendar.refresh(self.url)
+			return time.time() + self.poll_interval
+
+		return time.time() + DISCOVERY_INTERVAL
+
+	''' Returns the time at which the given match next needs an action:
+	    its posting time if it hasn't been posted, then a fast poll while
+	    it's live, backing off at half time and after full time. '''
+	def _next_deadline(self, match):
+
+		now = time.time()
+		if not match.is_posted:
+			# If we've already tried to post, ESPN probably hasn't filled
+			# in the match page yet, so we'll try again on the next poll.
+			if match.post_attempts:
+				now += self.poll_interval
+			try:
+				return max(now, self._post_time(match))
+			except (IndexError, ValueError) as exc:
+				print 'scheduler error: ', str(exc)
+				metrics.error('post_time', exc)
+				return now + self.poll_interval
+		elif match.url in self.in_flight:
+			return now + self.poll_interval
+		elif match.is_ft:
+			return now + FULL_TIME_INTERVAL
+		elif match.game_time == 'HT':
+			return now + HALF_TIME_INTERVAL
+
+		return now + self.poll_interval
+
+	''' Get the time interval between today and the posting window of the
+	    next match in any of our competitions, or None if there are no
+	    matches coming up. '''
+	def _get_interval(self):
+
+		# The calendar only fetches each scoreboard page once, however many
+		# competitions we ask it about.
+		intervals = []
+		for name, competition in self.competitions.items():
+			n_match = self.calendar.next_match(name)
+			if n_match:
+				interval = self._get_time_until(
+						[n_match['date'], n_match['kickoff']],
+						competition['hours_before']
+				)
+				intervals.append((interval, n_match['page']))
+
+		if not intervals:
 			return None
-		
-		# Get the dates and times for all games on the next match day.
-		dates = []; times = []
-		for e in tree.xpath('//div[@class="game-status"]'):
-		    if e.xpath('span[@class="game-date"]') and e.xpath('span[@class="game-time"]'):
-		            date = e.xpath('span[@class="game-date"]')[0]
-		            time = e.xpath('span[@class="game-time"]')[0]
-			    dates.append(date); times.append(time)
-		
-		# Get all valid date-time pairs.
-		dts   = [
-		  	  [_date.text_content(), date_parser.parse(_time.text_content())]
-			  for _date, _time in zip(dates, times)
-			  if _time.text_content().lower() != 'ft'
-			  and _time.xpath('../../../../../../../../a/h2')[0].\
-			            text_content().lower() == 'super rugby'
-		]
-                
-		# Return the first match on the next match date if one is found.
-                if dts:
-                        match_date = min(dts, key=itemgetter(1))
-                else:
-                        match_date = None
 
-                return match_date
-	
-        ''' Returns the URL for the next possible match date. '''
-        def _get_next_url(self):
-
-            # Get tomorrows date.
-            time_diff = timedelta(days=+1)
-	    self.date += time_diff
-
-            next_month = self.date.month; next_day = self.date.day
-            
-            # ESPN date values have a '0' prepended to any single digit values.
-            _formatter = lambda t: '0{}'.format(t) if t < 10 else t
-            url = (self.base + '?date={}{}{}').\
-                  format(self.date.year, _formatter(next_month), _formatter(next_day))
-            
-	    return url
+		# The matches are fetched from the page we found the next match on.
+		interval, self.url = min(intervals, key=lambda i: self._seconds(i[0]))
+
+		# Return the time interval until our next match.
+		return interval
+
+	''' Returns the given relativedelta in seconds. '''
+	def _seconds(self, interval):
+
+		return (((interval.days * 24) * 60) * 60) +\
+		       ((interval.hours * 60) * 60) +\
+		       (interval.minutes * 60) +\
+		       (interval.seconds)
 
 	''' Returns a relativedelta object which represents the amount of time
 	    until the given match date and time.
 	    Args:
 	    	next_match: A tuple containing the date and time of the next match.
+		hours_before: The number of hours before kick off that we post.
 	'''
-	def _get_time_until(self, next_match):
+	def _get_time_until(self, next_match, hours_before):
 		
 		date, time = next_match[0], next_match[1]
 		
@@ -170,7 +308,7 @@ class Scheduler(object):
 		# Set the timezone to EST, and account for hours before.
                 EST_BST_TIME_DIFF = 5
 		time_diff = dateutil.relativedelta.relativedelta(
-				hours=(EST_BST_TIME_DIFF + self.hours_before)
+				hours=(EST_BST_TIME_DIFF + hours_before)
 		)
 		delta -= time_diff
 		
@@ -183,87 +321,201 @@ class Scheduler(object):
 	''' Run the scheduler and determine which operation to perform. If a match
 	    thread exists, and is active, then we update it. If it exists and is 
 	    not active then we remove it. If no match thread exists then we create one.
+	    Args:
+	    	matches: The matches whose next action is due.
 	'''
-	def _run_scheduler(self):
-		
-	        print
-		# Cycle through the cache and perform the appropriate action.
-		for match in self.cache:
-			print match.home_team['name'], ' vs ', match.away_team['name']
-                        try:
-                            if match.is_posted and match.is_active:
-                                    match.update_thread()
-                                    print 'updating ', match
-                            elif match.is_posted and (not match.is_active):
-                                    print 'removing ', match
-                                    self.cache.remove(match)
-                            elif self._is_ready(match) and (not match.is_posted):
-                                    print self._is_ready(match)
-                                    match.post_thread(target_sub=self.target_sub)
-                                    print 'posting ', match
-                            else:
-                                    print 'no action'
-                        except Exception as rs:
-                            print 'scheduler error: ', str(rs)
+	def _run_scheduler(self, matches):
+		
+		print
+		self._collect_late()
+
+		# Cycle through the due matches and determine the appropriate action.
+		# The network bound work is handed to the pool so that all matches
+		# are fetched and re-rendered in parallel.
+		# A match that fails here only loses its own action for the cycle.
+		jobs = {}
+		for match in matches:
+			print match
+			try:
+				if match.url in self.in_flight:
+					print 'still updating ', match
+				elif match.is_posted and match.is_active:
+					jobs[match] = self.pool.submit(match.update_thread)
+					print 'updating ', match
+				elif match.is_posted and (not match.is_active):
+					print 'removing ', match
+					self.cache.remove(match)
+					self.state.save([match])
+				elif writer.is_pending(('submit', match.url)):
+					print 'waiting to post ', match
+				elif self._is_ready(match) and (not match.is_posted):
+					competition = self.competitions[match.competition_key]
+					jobs[match] = self.pool.submit(match.post_thread,
+								       competition['target_sub'])
+					print 'posting ', match
+				else:
+					print 'no action'
+			except Exception as exc:
+				print 'scheduler error: ', str(exc)
+				metrics.error('scheduler', exc)
+
+		# Wait for the batch. A slow match page only costs us its own update.
+		self.pool.wait(jobs.values(), self.deadline)
+		for match, job in jobs.items():
+			if job.late:
+				print 'deadline exceeded ', match
+				metrics.inc('rugby_late_updates_total')
+				self.in_flight[match.url] = (match, job)
+			elif job.error:
+				print 'scheduler error: ', str(job.error)
+				metrics.error('match', job.error)
+
+		self.state.save([match for match, job in jobs.items() if not job.late])
+
+		# Report how many thread edits were actually sent to Reddit.
+		edits = dict((key, sum(match.edits[key] for match in self.cache))
+			     for key in ('pushed', 'skipped', 'deferred'))
+		print 'edits pushed: ', edits['pushed'], \
+		      ' skipped: ', edits['skipped'], \
+		      ' deferred: ', edits['deferred']
+		print 'writes sent: ', writer.stats['sent'], \
+		      ' merged: ', writer.stats['merged'], \
+		      ' retried: ', writer.stats['retried'], \
+		      ' dropped: ', writer.stats['dropped']
+
+	''' Clear out any late updates that have since finished. '''
+	def _collect_late(self):
+
+		for url, (match, job) in self.in_flight.items():
+			if job.done.is_set():
+				if job.error:
+					print 'scheduler error: ', str(job.error)
+					metrics.error('match', job.error)
+				self.state.save([match])
+				del self.in_flight[url]
 
 	''' Returns a list of Match objects that are not currently in the
 	    scheduler's cache. '''
 	def _get_matches(self):
 		
-		request = requests.get(self.url)
-		tree = html.fromstring(request.content)
+		tree = fetcher.fetch(self.url).tree
 
 		# Get the relative match URLs, and create full URLs. If the URL
 		# does not belong to a Match already in our cache then we can add it.
-		schedule = tree.xpath('//a[@class="competitors"]')
+		schedule = select('scoreboard.matches', tree)
 		
-		# Append a Match to our cache iff it hasn't already been added, and is
-		# ready to be added.
+		# Append a Match to our cache iff it belongs to one of our
+		# competitions, hasn't already been added (by this run or a previous
+		# one), and is ready to be added.
+		# Matches are routed by the scoreboard, so we never fetch the match
+		# page of a competition we aren't tracking.
 		matches = []
 		for match in schedule:
+			heading = select('scoreboard.match_competition', match)
+			if not heading:
+				continue
+			key = heading[0].text_content().lower()
+			if key not in self.competitions:
+				continue
+
 			match_url = self.base_url + match.get('href')
+			if self.state.status(match_url) == 'finished':
+				continue
+
+			# Start the match off with what the scoreboard tells us. The
+			# rest of the match page is only scraped when it's needed.
+			fixture = self._get_fixture(match)
+			if fixture and fixture['time'].lower() == 'ft':
+				continue
+
 			print 'getting ', match_url
 			try:
 			    if not any((match.url == match_url) for match in self.cache):
-			        matches.append(Match(self.base_url + match.get('href')))
+			        matches.append(Match(match_url, competition_key=key,
+						     edit_window=self.edit_window,
+						     fixture=fixture))
 			except IndexError:
 			    pass
 		
-		matches = [match for match in matches
-			  if match.competition.lower().find('super rugby') != -1]
-		
 		return matches
 	
-	''' Determines if the match is ready to be posted. '''
+	''' Returns the date and time the scoreboard lists for the given match
+	    link, or None if it doesn't list them. '''
+	def _get_fixture(self, link):
+
+		status = select('scoreboard.match_status', link)
+		if not status:
+			return None
+
+		date = select('scoreboard.date', status[0])
+		time = select('scoreboard.time', status[0])
+		if not (date and time):
+			return None
+
+		return {'date': date[0].text_content(), 'time': time[0].text_content()}
+
+	''' Determines if the match is ready to be posted. A match whose page
+	    can't be read yet isn't ready. '''
 	def _is_ready(self, match):
 
+		try:
+			return time.time() >= self._post_time(match)
+		except (IndexError, ValueError, requests.RequestException) as exc:
+			print 'scheduler error: ', str(exc)
+			metrics.error('post_time', exc)
+			return False
+
+	''' Returns the time (in seconds since the epoch) at which the match
+	    should be posted, i.e. 'hours_before' hours before kick off. '''
+	def _post_time(self, match):
+
+		# Matches that were under way when we found them don't have a kick
+		# off time from the scoreboard, so we need the match page's.
+		if match.kickoff_time is None:
+			match.load('header')
+
 		EST_BST_TIME_DIFF = 5
 		match_time = date_parser.parse(match.kickoff_time)
-                
-                # Format the game's date.
-                date = date_parser.parse(match.date)
-                day   = date.day
-                month = date.month
-                
-                # Account for the time difference, and set the datetime fields.
-                TIME_DIFF = match_time.hour - EST_BST_TIME_DIFF
-		match_time = match_time.replace(hour=TIME_DIFF, month=month, day=day)
-                
-                # Find the number of minutes until the match. If this is less than the
-		# given 'hours_before' arg, then the match is ready to be posted.
-		delta = dateutil.relativedelta.relativedelta(match_time, datetime.now())
-		delta_minutes = (delta.hours * 60) + (delta.minutes)
-                
-                return delta_minutes <= (self.hours_before * 60)
+		hours_before = self.competitions[match.competition_key]['hours_before']
+
+		# Format the game's date. The scoreboard gives us 'day/month'.
+		date = date_parser.parse(match.date, dayfirst=True)
+		match_time = match_time.replace(month=date.month, day=date.day)
+
+		# Account for the time difference, and the posting window.
+		match_time -= timedelta(hours=(EST_BST_TIME_DIFF + hours_before))
+
+		return time.mktime(match_time.timetuple())
 
 
 '''   Represents a rugby union match. '''
 class Match(object):
 
-        ''' Create a Match object. '''
-        def __init__(self, url):
+	# The fields saved by to_state(), and restored on a warm restart.
+	STATE_FIELDS = [
+			'competition', 'venue', 'kickoff_time', 'date', 'game_time',
+			'thread', 'home_team', 'away_team',
+			'is_posted', 'is_active', 'is_ft', 'is_over',
+			'last_edit', 'pushed', 'edits', 'stages'
+	]
+
+        ''' Create a Match object.
+	    Args:
+	    	url: The URL of the match page.
+		competition_key: The name of the tracked competition the match
+				 was routed to.
+		edit_window: The minimum number of seconds between two edits
+			     of the match thread.
+		state: A saved state to restore the match from, rather than
+		       scraping the match page.
+		fixture: The match's 'date' and kick off 'time' from the
+			 scoreboard. If given, nothing is scraped until needed.
+	'''
+        def __init__(self, url, competition_key=None, edit_window=0, state=None,
+		     fixture=None):
 
                 self.url = url
+		self.competition_key = competition_key
 
                 # Match data.
 		self.competition  = None
@@ -271,7 +523,7 @@ class Match(object):
 		self.kickoff_time = None
                 self.date         = None
                 self.game_time    = None
-		self.key_events	  = None
+		self.events	  = EventLog()
 		self.post 	  = None
 		
 		self.thread    = {}
@@ -284,56 +536,112 @@ class Match(object):
                 self.is_ft     = False
                 self.is_over   = False
 
-                # Initialize static fields, and get current dynamic fields.
-		self.setup_gamethread()
+		# Tracks what we last pushed to Reddit, so that we only edit the
+		# thread when its body has actually changed.
+		self.edit_window = edit_window
+		self.last_edit	 = 0
+		self.pushed	 = {}
+		self.edits	 = {'pushed': 0, 'skipped': 0, 'deferred': 0}
+
+		# The hash of each rendered section, updated as the section is.
+		self.hashes	 = {}
+
+		# The match page is scraped in stages: the 'header' (teams, score
+		# and kick off), then the 'details' (venue and lineups). ESPN often
+		# only fills in the details shortly before kick off, so we leave
+		# them until we're about to post.
+		self.stages	   = []
+		self.post_attempts = 0
+
+		if state:
+			self._restore(state)
+		elif fixture:
+			self._setup_fixture(fixture)
+		else:
+			self.load('header')
+
+	''' Returns the teams playing, if we know them yet, or the match URL. '''
+	def __str__(self):
+
+		if 'header' in self.stages:
+			return self.home_team['name'] + ' vs ' + self.away_team['name']
+
+		return self.url
  
- 	''' Create a thread for this Match.
+ 	''' Returns the match's state as a JSON serializable dict. '''
+	def to_state(self):
+
+		if not self.is_posted:
+			status = 'pending'
+		elif self.is_active:
+			status = 'live'
+		else:
+			status = 'finished'
+
+		data = {}
+		for field in self.STATE_FIELDS:
+			data[field] = getattr(self, field)
+		data['events_over'] = self.events.is_over
+
+		return {
+				'status': status,
+				'submission_id': self.post.id if self.post else None,
+				'data': data,
+				'events': self.events.events
+		}
+
+	''' Restore the match from a state returned by to_state(). '''
+	def _restore(self, state):
+
+		for field in self.STATE_FIELDS:
+			if field in state['data']:
+				setattr(self, field, state['data'][field])
+
+		# A match that hasn't been updated yet has no events section.
+		self.events.restore(state['events'],
+				    self.thread.get('events') or EVENTS_HEADER,
+				    state['data']['events_over'])
+
+	''' Create a thread for this Match.
 	    Args:
 	    	target_sub: A praw.models.subreddit instance to post our submission to.
 	'''
 	def post_thread(self, target_sub):
 		
-		# Thread title.
-		self.thread['title'] = "Match Thread: " + \
-				self.home_team['name'] + ' vs ' +  \
-				self.away_team['name'] + ' [' + self.competition + '] ' +\
-				self._format_timezones()
-
-		# Title / Header.
-		self.thread['header'] = self._format_header()
+		# Make sure the lineups are in before we post.
+		self.post_attempts += 1
+		self.load('header', 'details')
+
+		# The title and lineups won't change, so they're only rendered now.
+		with metrics.timer('rugby_render_seconds', section='title'):
+			self.thread['title'] = render.title(self)
+		with metrics.timer('rugby_render_seconds', section='lineups'):
+			self._set_section('lineups', render.lineups(self))
+		with metrics.timer('rugby_render_seconds', section='header'):
+			self._set_section('header', render.header(self))
 		
 		# TODO: Post scorers.
 		#thread += ', '.join([' '.join(_try) for _try in self.home_team['tries']])
 		
-		# Lineups: Starters, then Replacements.
-		self.thread['lineups'] = "## **Starting Lineups**:\n\n"
-		self.thread['lineups'] += "**" + self.home_team['name'] + "**" + \
-					  " | **Position** ""| " + \
-					  "**" + self.away_team['name'] + "**\n"
-		self.thread['lineups'] += ":-|:-|:-\n"
-		for h_player, a_player in zip(self.home_team['starters'],
-					      self.away_team['starters']):
-			self.thread['lineups'] += str(h_player[0]) + '.  ' + \
-						  h_player[1] + ' | ' + h_player[2] + ' | '
-			self.thread['lineups'] += str(a_player[0]) + '.   ' + \
-						  a_player[1] + '\n'
-		self.thread['lineups'] += "\n## **Replacements**:\n"
-		self.thread['lineups'] += "**" + self.home_team['name'] + "**" + \
-					  " | **Position** ""| " + \
-					  "**" + self.away_team['name'] + "**\n"
-		self.thread['lineups'] += ":-|:-|:-\n"
-		for h_sub, a_sub in zip(self.home_team['subs'], self.away_team['subs']):
-			self.thread['lineups'] += str(h_sub[0]) + '.   ' + \
-						  h_sub[1] + ' | ' + h_sub[2]  + ' | '
-			self.thread['lineups'] += str(a_sub[0]) + '.   ' + a_sub[1] + '\n'
-		self.thread['lineups'] += '\n\n----\n\n'
-		
-		# Post the thread, and update the posted flag.
-		self.post = target_sub.submit(
-				title=self.thread['title'],
-			 	selftext=self.thread['header'] + self.thread['lineups']
-		)
-		
+		# Queue the thread to be posted. The posted flag is set once it is.
+		writer.put(('submit', self.url), self, PRIORITY_POST, self._submit,
+			   target_sub, self.thread['title'], render.body(self.thread),
+			   self._hash_sections())
+
+	''' Submit the thread. Called by the writer.
+	    Args:
+	    	target_sub: The subreddit to post to.
+		title: The thread's title.
+		body: The thread's body.
+		hashes: The hashes of the body's sections.
+	'''
+	def _submit(self, target_sub, title, body, hashes):
+
+		self.post = target_sub.submit(title=title, selftext=body)
+
+		self.pushed    = hashes
+		self.last_edit = time.time()
+
 		self.is_posted = True
 		self.is_active = True
 
@@ -341,13 +649,14 @@ class Match(object):
 	    values here. '''
 	def update_thread(self):
 
-                request = requests.get(self.url)
-                tree = html.fromstring(request.content)
+		page = fetcher.fetch(self.url)
+		tree = page.tree
 
-		# Get the current score, and the game time.
-		self.home_team['score'], self.away_team['score'] = self._get_score(tree)
-		self.game_time = self._get_time(tree)
-		self.thread['header'] = self._format_header()
+		# Get the current score, and the game time. A match page that hasn't
+		# changed since we last read it has no new score for us. The
+		# commentary is a page of its own, so its events are still read.
+		if page.changed or 'events' not in self.thread:
+			self._set_score(self._get_score(tree), self._get_time(tree))
 
 		# If the game is over, then we need to set our is_active flag accordingly.
 		if self.game_time == 'FT':
@@ -364,110 +673,97 @@ class Match(object):
                 self.away_team['tries'] = self._get_tries(a_tries)
 		'''
 
-		# Get the current events tree.
-		self.events = self._get_events(tree)
-		self.thread['events'] = self._format_events()
-                
+		# Add any new events to the events section.
+		self.events.ingest(self._get_events(tree))
+		self._set_section('events', self.events.section)
+		self.is_over = self.events.is_over
+
                 if self.is_ft and self.is_over:
                     self.is_active = False
 
-                # Perform the update.
-		self.post = self.post.edit(
-				body=self.thread['header'] + self.thread['lineups'] + \
-				     self.thread['events']
-		)
+                # Perform the update. The final score always goes out straight away.
+		self._push_edit(force=self.is_ft)
 
-	''' Format the kick off times into different timezones. '''
-	def _format_timezones(self):
+	''' Edit the thread iff its body differs from the last one we pushed.
+	    Edits are coalesced so that we push at most one per edit window.
+	    Args:
+	    	force: Push any change immediately, ignoring the edit window.
+	'''
+	def _push_edit(self, force=False):
+
+		hashes = self._hash_sections()
+		if hashes == self.pushed:
+			self.edits['skipped'] += 1
+			metrics.inc('rugby_edits_total', result='skipped')
+			return
+
+		# Hold the change back if we edited recently. It will go out on a
+		# later poll, merged with anything else that changes in the meantime.
+		if not force and (time.time() - self.last_edit) < self.edit_window:
+			self.edits['deferred'] += 1
+			metrics.inc('rugby_edits_total', result='deferred')
+			return
+
+		# Any edit still waiting in the writer's queue is replaced by this
+		# one. The final score jumps the queue.
+		priority = PRIORITY_FINAL if force else PRIORITY_EDIT
+		writer.put(('edit', self.url), self, priority, self._edit,
+			   render.body(self.thread), hashes)
+
+	''' Edit the thread. Called by the writer.
+	    Args:
+	    	body: The thread's new body.
+		hashes: The hashes of the body's sections.
+	'''
+	def _edit(self, body, hashes):
 
-		bst = date_parser.parse(self.kickoff_time)
-		nz  = bst.replace(hour=(bst.hour + 11) % 24)
-		au  = bst.replace(hour=(bst.hour + 9) % 24)
-		sa  = bst.replace(hour=(bst.hour + 1) % 24)
-		est = bst.replace(hour=(bst.hour - 5) % 24)
-		
-		regions = [
-				('BST', bst), ('NZ', nz), ('AU', au),
-				('SA', sa), ('EST', est)
-		]
-		
-		timezones = []
-		for tz in regions:
-			hour = str(tz[1].hour)
-			minute = str(tz[1].minute)
-			
-			# Prepend a '0' to any single digit value.
-			if tz[1].hour   < 10: hour   = '0' + hour
-			if tz[1].minute < 10: minute = '0' + minute
+		self.post = self.post.edit(body=body)
+		self.pushed    = hashes
+		self.last_edit = time.time()
+		self.edits['pushed'] += 1
+		metrics.inc('rugby_edits_total', result='pushed')
 
-			timezones.append(hour + ':' + minute + ' ' + tz[0])
-		
-		return ', '.join(timezones)
+	''' Returns a dict mapping each section of the thread body to a hash
+	    of its contents. Sections are only hashed when they change. '''
+	def _hash_sections(self):
 
-	''' Format the thread header using Markdown syntax. '''
-	def _format_header(self):
-		
-		# If the game is active then we'll use a different delimiter.
-		DELIM = ' - '
-		if (self.home_team['score'] == '') and (self.away_team['score'] == ''):
-			DELIM = ' vs '
-		
-		# Format the team names with their respective flairs and scores.
-		header = '# ' + self.game_time + ': ' + \
-			  self.home_team['name'] + ' ' + self.home_team['flair'] + ' ' + \
-			  self.home_team['score'] + DELIM + self.away_team['score'] + ' ' +\
-			  self.away_team['flair'] + ' ' + self.away_team['name'] + '\n\n'
-
-		# Format venue and kickoff time.
-		header += '### **Venue**: ' + self.venue + '\n\n' + \
-			  '### **Kickoff Time**: ' + self.kickoff_time + ' BST' +\
-			  '\n\n----\n\n'
-
-		return header
-
-	''' Format the match events using Markdown syntax. '''
-	def _format_events(self):
-
-		event_flairs = {
-				'red card': '[](#red)',
-				'yellow card': '[](#yellow)',
-				'substitute': '[](#sub)', 'substituted': '[](#sub)',
-				'try': '[](#try)',
-				'conversion': '[](#conv)',
-				'penalty': '[](#pen)',
-				'drop': '[](#drop)'
-		}
-		
-		key_events = ['red card', 'yellow card', 'try', 'conversion', 'penalty']
-		events = "## **Match Events**:\n"
-		for event in self.events:
-                        if event[1].lower().find('end of second half') != -1:
-                            self.is_over = True
-			
-                        # Check for a flair.
-			flair = [
-					f for f in event_flairs.keys()
-					if event[1].lower().find(f) != -1
-			]
-			
-			# Prepend the flair markdown. Bold the event if necessary.
-			if flair:
-				if flair[0] in key_events:
-					event[1] = '**' + event[1] + '**'
-				
-				event[1] = event_flairs[flair[0]] + ' ' + event[1]
-			
-                        # Format stoppage time text.
-                        '''
-                        if event[1][0] == '+' and \
-                           event[1].lower().find('end of first half') == -1:
-                            prefix = event[1].split(str(self.home_team['score']))[0]
-                            event[1] = prefix + ' ' + str(self.home_team['score']) + \
-                                       event[1].split(str(self.home_team['score']))[1]
-			'''
-                        events += '\n\n**' + event[0] + "'**  " + event[1]
-                
-		return events
+		for section in render.SECTIONS:
+			if section not in self.hashes:
+				body = self.thread.get(section, u'')
+				self.hashes[section] = hashlib.md5(
+						body.encode('utf-8')).hexdigest()
+
+		return dict(self.hashes)
+
+	''' Update the score and the game time. The header is only re-rendered
+	    if either has moved.
+	    Args:
+	    	score: A (home score, away score) tuple.
+		game_time: The current time in the game.
+	'''
+	def _set_score(self, score, game_time):
+
+		if (score, game_time) == ((self.home_team['score'],
+					   self.away_team['score']), self.game_time):
+			return
+
+		self.home_team['score'], self.away_team['score'] = score
+		self.game_time = game_time
+		with metrics.timer('rugby_render_seconds', section='header'):
+			self._set_section('header', render.header(self))
+
+	''' Replace a section of the thread body, if it has changed.
+	    Args:
+	    	section: The name of the section.
+		body: The section's rendered markdown.
+	'''
+	def _set_section(self, section, body):
+
+		if self.thread.get(section) == body:
+			return
+
+		self.thread[section] = body
+		self.hashes.pop(section, None)
 
         ''' Parse the website linked via the 'url' parameter, and return all
             relevant match info (e.g. score, current time in game, etc). All static
@@ -477,27 +773,59 @@ class Match(object):
         '''
         def setup_gamethread(self):
 
-                request = requests.get(self.url)
-                tree = html.fromstring(request.content)
+		self.stages = []
+		self.load('header', 'details')
+
+	''' Scrape any of the given stages that we haven't already. Raises an
+	    IndexError if ESPN hasn't filled them in yet, in which case the next
+	    call will try again.
+	    Args:
+	    	*stages: The names of the stages to load.
+	'''
+	def load(self, *stages):
+
+		missing = [stage for stage in stages if stage not in self.stages]
+		if not missing:
+			return
+
+		tree = fetcher.fetch(self.url).tree
+		for stage in missing:
+			getattr(self, '_setup_' + stage)(tree)
+			self.stages.append(stage)
+
+	''' Set up the match from the scoreboard's listing of it.
+	    Args:
+	    	fixture: A dict of the match's 'date' and kick off 'time'.
+	'''
+	def _setup_fixture(self, fixture):
 
-                # Get the competition and venue names.
-                competition = tree.xpath('//*[@id="custom-nav"]/header/div[1]')[0]
+		self.date = fixture['date']
+
+		# Matches that are under way list the game clock, not a kick off.
+		if parse_kickoff(fixture['time']):
+			self.kickoff_time = fixture['time'].strip()
+		else:
+			self.kickoff_time = None
+
+	''' Scrape the competition, kick off, teams, score and game time.
+	    Args:
+	    	tree: The HTML document tree.
+	'''
+	def _setup_header(self, tree):
+
+                # Get the competition name.
+                competition = select_one('match.competition', tree)
                 self.competition = competition.text_content()
-	 
-	 	venue = tree.xpath('//div[@class="game-details location-details"]')[0]
-		self.venue = venue.text_content().split(':')[1]
 
 		# Get the game's kickoff time, and date.
-                game_time_details = tree.xpath('//div[@class="game-date-time"]')[0]
+                game_time_details = select_one('match.date_time', tree)
                 game_time_details = game_time_details.text_content().split(',')
                 self.kickoff_time = game_time_details[0]
                 self.date    	  = game_time_details[1]
 
 		# Get the team names, their flare, and their current score.
-                h_team  = tree.xpath('//*[@id="custom-nav"]/header/div[2]'
-                                     '/div[1]/div/div[2]/div/div/a/span[2]')[0]
-                a_team  = tree.xpath('//*[@id="custom-nav"]/header/div[2]'
-                                     '/div[3]/div/div[3]/div/div/a/span[2]')[0]
+                h_team  = select_one('match.home_team', tree)
+                a_team  = select_one('match.away_team', tree)
                 
 		self.home_team['name']  = h_team.text_content()
                 self.away_team['name']  = a_team.text_content()
@@ -509,16 +837,21 @@ class Match(object):
 
                 # Get the current game time.
 		self.game_time = self._get_time(tree)
+
+	''' Scrape the venue, and the team lineups.
+	    Args:
+	    	tree: The HTML document tree.
+	'''
+	def _setup_details(self, tree):
+
+	 	venue = select_one('match.venue', tree)
+		self.venue = venue.text_content().split(':')[1]
 		
 		# Get the team lineups (starters & subs).
-                h_lineup = tree.xpath('//*[@id="main-container"]/div/div/div[1]/'
-                                'article[1]/div/div[1]/div/div/div/table/tbody[1]')[0]
-                h_subs   = tree.xpath('//*[@id="main-container"]/div/div/div[1]/'
-                                'article[1]/div/div[1]/div/div/div/table/tbody[2]')[0]
-		a_lineup = tree.xpath('//*[@id="main-container"]/div/div/div[1]/'
-				'article[1]/div/div[2]/div/div/div/table/tbody[1]')[0]
-		a_subs	 = tree.xpath('//*[@id="main-container"]/div/div/div[1]/'
-				'article[1]/div/div[2]/div/div/div/table/tbody[2]')[0]
+                h_lineup = select_one('match.home_starters', tree)
+                h_subs   = select_one('match.home_subs', tree)
+		a_lineup = select_one('match.away_starters', tree)
+		a_subs	 = select_one('match.away_subs', tree)
 
                 self.home_team['starters'] = self._get_lineup(h_lineup)
                 self.home_team['subs'] 	   = self._get_lineup(h_subs)
@@ -530,83 +863,8 @@ class Match(object):
 	    	name: The name of the team.
 	'''
 	def _get_flair(self, name):
-		
-		# Team flairs.
-		flairs = {
-				# Premiership:
- 				'wasps': '[](#wasps)',
-				'exeter-chiefs': '[](#exeter-chiefs)',
-				'saracens': '[](#saracens)', 'bath': '[](#bath)',
- 				'leicester': '[](#leicester)',
-				'northampton': '[](#northampton)',
- 				'harlequins': '[](#harlequins)',
-				'newcastle': '[](#newcastle)',
-				'gloucester': '[](#gloucester)',
-				'sale': '[](#sale)', 'worcester': '[](#worcester)',
- 				'bristol': '[](#bristol)',
-				
-				# PRO 12:
-				'leinster': '[](#leinster)', 'ospreys': '[](#ospreys)',
-				'munster': '[](#munster)', 'ulster': '[](#ulster)',
-				'llanelli-scarlets': '[](#llanelli-scarlets)',
-				'glasgow': '[](#glasgow)', 'connacht': '[](#connacht)',
-				'cardiff-blues': '[](#cardiff-blues)',
-				'edinburgh': '[](#edinburgh)', 'dragons': '[](#newport)',
-				'treviso': '[](#treviso)', 'zebre': '[](#zebre)',
-
-				# TOP 14:
-				'larochelle': '[](#larochelle)',
-				'clermont-auvergne': '[](#clermont-auvergne)',
- 				'montpellier': '[](#montpellier)', 'pau': '[](#pau)',
-				'castres': '[](#castres)', 'toulon': '[](#toulon)',
- 				'racing-metro': '[](#racing-metro)',
-				'bordeaux': '[](#bordeaux)', 'brive': '[](#brive)',
- 				'toulousain': '[](#toulousain)', 'lyon': '[](#lyon)',
- 				'paris': '[](#paris)', 'grenoble': '[](#grenoble)',
- 				'bayonne': '[](#bayonne)',
-
-				# Super Rugby:
-				'waikato-chiefs': '[](#waikato-chiefs)',
-				'jaguares': '[](#jaguares)', 'stormers': '[](#stormers)',
-				'brumbies': '[](#brumbies)', 'crusaders': '[](#crusaders)',
-				'hurricanes': '[](#hurricanes)', 'lions': '[](#lions)',
-				'blues': '[](#blues)', 'sharks': '[](#sharks)',
- 				'cheetahs': '[](#cheetahs)', 'reds': '[](#reds)',
-				'bulls': '[](#bulls)',
-				'western-force': '[](#western-force)',
-				'southern-kings': '[](#southern-kings)',
-				'highlanders': '[](#highlanders)',
-				'waratahs': '[](#waratahs)', 'sunwolves': '[](#sunwolves)',
- 				'melbourne-rebels': '[](#melbourne-rebels)'
-		}
 
-		# Reformat name.
-		name = name.lower()
-		if len(name.split(' ')) > 1:
-			name = '-'.join(name.split(' '))
-		
-		# Check for matches.
-		if name in flairs:
-			return flairs[name]
-		else:
-			split_name = name.split('-')
-			try:
-				if (split_name[0] + split_name[1]) in flairs:
-					return flairs[split_name[0] + split_name[1]]
-			except IndexError: pass
-			
-			# Get all possible matches. We then return the closest match
-			# i.e. the one with the longest key.
-			matches = {}
-			for _name in split_name:
-				results = [f for f in flairs.keys() if f.find(_name) != -1]
-				if results: matches[_name] = results
-			if matches:
-				name = max(matches.keys(), key=len)
-				name = matches[name][0]
-				return flairs[name]
-		
-		return ""
+		return flairs.resolve(name)
 
 	''' Get the current score, and return a tuple like so: (home score, away score)
 	    Args:
@@ -614,10 +872,8 @@ class Match(object):
 	'''
 	def _get_score(self, tree):
      		
-		h_score = tree.xpath('//*[@id="custom-nav"]/header/div[2]'
-                                     '/div[1]/div/div[3]/div')[0]
- 		a_score = tree.xpath('//*[@id="custom-nav"]/header/div[2]'
-                                     '/div[3]/div/div[2]/div')[0]
+		h_score = select_one('match.home_score', tree)
+		a_score = select_one('match.away_score', tree)
 		
 		return (h_score.text_content(), a_score.text_content())
 
@@ -627,7 +883,7 @@ class Match(object):
 	'''
 	def _get_time(self, tree):
  
-		time = tree.xpath('//*[@id="custom-nav"]/header/div[2]/div[2]/span[3]')[0]
+		time = select_one('match.game_time', tree)
                 return time.text_content()
 
 	''' Parses the 'tries' div, and returns a list of tuples where the first
@@ -652,20 +908,11 @@ class Match(object):
         '''
         def _get_lineup(self, lineup_element):
 
-                # Go through each row and extract the player data. N.B. -- Sometimes
-		# ESPN will screw up the lineup formatting, so we'll need to handle this.
+		# Go through each row and extract the player data.
                 players = []
                 for row in lineup_element.getchildren():
-			try:
-				number = row.findall('.//span[@class="number"]')\
-					 [0].text_content()
-				player = row.findall('.//span[@class="name"]')\
-					 [0].text_content()
-			except IndexError:
-				number = row.findall('.//td[@class="number"]')\
-					 [0].text_content()
-				player = row.findall('.//td[@class="date"]')\
-					 [0].text_content()
+			number = select_one('lineup.number', row).text_content()
+			player = select_one('lineup.name', row).text_content()
 			
 			name = player.split(',')[0]
 			pos  = player.split(',')[1].strip()
@@ -676,52 +923,82 @@ class Match(object):
 		players.sort(key=itemgetter(0))
 		return players
 
-	''' Get all key events during the match.
+	''' Get the rows of the match's commentary table, newest first.
 	    Args:
-		    events_url: The URL to the match's commentary page.
+		    tree: The HTML document tree of the match page.
 	'''
 	def _get_events(self, tree):
 		
-		# Get the URL of the events page. N.B. -- The XPath of this element
-		# changes from time to  time, so we need to handle this.
-		try:
-			e_href = tree.xpath('//*[@id="main-container"]/div/div/div[2]'
-				    '/article[2]/footer/a')[0].get('href')
-		except IndexError:
-			e_href = tree.xpath('//*[@id="main-container"]/div/div/div[2]'
-				     '/article[1]/footer/a')[0].get('href')
+		# Get the URL of the events page.
+		e_href = select_one('match.commentary_link', tree).get('href')
 
 		events_url     = self.url.split('/rugby/match?')[0] + e_href
-		events_request = requests.get(events_url)
-		events_tree    = html.fromstring(events_request.content)
+		events_tree    = fetcher.fetch(events_url).tree
 
-		# Return a list of events from the table element. N.B. -- We need
-		# to reverse the list as ESPN formats it in reverse chronological order.
-		events = events_tree.xpath('//*[@id="tab1"]/table/tbody')[0]
-		return [ 
-				event.text_content().split("'")
-				for event in events.getchildren()
-		][::-1]
+		# N.B. -- ESPN formats the table in reverse chronological order.
+		events = select_one('commentary.table', events_tree)
+		return events.getchildren()
 
 
 # ========================================================================
 
-r = praw.Reddit(client_id=CLIENT_ID,
-		client_secret=CLIENT_SECRET,
-		user_agent=USER_AGENT,
-		username=USERNAME,
-		password=PASSWORD
-)
-
 URL	       = 'http://www.espn.co.uk'
-SUBREDDIT_NAME = 'rugbyunion'
 CACHE_SIZE     = 20
 POLL_INTERVAL  = 30
-HOURS_BEFORE   = 2
+HALF_TIME_INTERVAL = 120
+FULL_TIME_INTERVAL = 60
+DISCOVERY_INTERVAL = 3600
+CALENDAR_WINDOW    = 14
+CALENDAR_MAX_DAYS  = 90
+CALENDAR_TTL	   = 6 * 60 * 60
+CALENDAR_RETRY_TTL = 5 * 60
+CALENDAR_FILE	   = 'calendar.json'
+STATE_FILE	   = 'rugby_bot.db'
+MAX_WORKERS    = 8
+MATCH_DEADLINE = 20
+EDIT_WINDOW    = 60
+REQUEST_TIMEOUT = 10
+WRITE_BUDGET	  = 30
+WRITE_PERIOD	  = 60
+WRITE_ATTEMPTS	  = 5
+WRITE_BACKOFF	  = 2
+WRITE_MAX_BACKOFF = 300
+METRICS_PORT	  = 9108
+METRICS_FILE	  = 'metrics.json'
+
+# The competitions to post match threads for. Names are as they appear in
+# the scoreboard's headings (lower case).
+COMPETITIONS   = [
+		{'name': 'super rugby', 'subreddit': 'rugbyunion', 'hours_before': 2},
+]
+
+# All ESPN pages are fetched through one pooled session.
+fetcher = Fetcher(pool_size=MAX_WORKERS, timeout=REQUEST_TIMEOUT)
+
+# Team flairs are indexed once, from flairs.json.
+flairs = FlairIndex()
+
+# All Reddit writes go out through one rate limited queue.
+writer = RedditWriter(budget=WRITE_BUDGET, period=WRITE_PERIOD,
+		      max_attempts=WRITE_ATTEMPTS, backoff=WRITE_BACKOFF,
+		      max_backoff=WRITE_MAX_BACKOFF)
 
 if __name__=='__main__':
 
-        scheduler = Scheduler(url=URL, subreddit_name=SUBREDDIT_NAME,
-			      cache_size=CACHE_SIZE, hours_before=HOURS_BEFORE)
+	r = praw.Reddit(client_id=CLIENT_ID,
+			client_secret=CLIENT_SECRET,
+			user_agent=USER_AGENT,
+			username=USERNAME,
+			password=PASSWORD
+	)
+
+	# Serve the metrics locally, e.g. for Prometheus to scrape.
+	if METRICS_PORT:
+		MetricsServer(METRICS_PORT, metrics)
+
+	scheduler = Scheduler(url=URL, competitions=COMPETITIONS,
+			      cache_size=CACHE_SIZE, max_workers=MAX_WORKERS,
+			      match_deadline=MATCH_DEADLINE,
+			      edit_window=EDIT_WINDOW)
 	scheduler.run_scheduler(POLL_INTERVAL)
 
@@ -0,0 +1,91 @@
+#
+# State: Crash-safe store for the scheduler's matches, so that a restart
+# can pick up where it left off without re-scraping or double-posting.
+#
+# ========================================================================
+
+
+import json
+import time
+import sqlite3
+import threading
+
+
+SCHEMA = '''
+	CREATE TABLE IF NOT EXISTS matches (
+		url		TEXT PRIMARY KEY,
+		competition_key	TEXT,
+		status		TEXT NOT NULL,
+		submission_id	TEXT,
+		data		TEXT NOT NULL,
+		events		TEXT NOT NULL,
+		updated		REAL NOT NULL
+	)
+'''
+
+
+'''   A SQLite backed store of every match the scheduler has picked up. The
+      database runs in WAL mode, so each save is a small append and a crash
+      mid-write never loses what was already committed. '''
+class StateStore(object):
+
+	''' Open (or create) the store.
+	    Args:
+	    	path: The path of the SQLite database.
+	'''
+	def __init__(self, path):
+
+		self.lock = threading.Lock()
+		self.db = sqlite3.connect(path, check_same_thread=False)
+		self.db.execute('PRAGMA journal_mode=WAL')
+		self.db.execute('PRAGMA synchronous=NORMAL')
+		self.db.execute(SCHEMA)
+		self.db.commit()
+
+	''' Save the current state of the given matches. '''
+	def save(self, matches):
+
+		rows = []
+		for match in matches:
+			state = match.to_state()
+			rows.append((
+					match.url, match.competition_key,
+					state['status'], state['submission_id'],
+					json.dumps(state['data']),
+					json.dumps(state['events']),
+					time.time()
+			))
+
+		with self.lock:
+			self.db.executemany('INSERT OR REPLACE INTO matches '
+					    'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+			self.db.commit()
+
+	''' Returns the saved state of every match that isn't finished. '''
+	def load(self):
+
+		with self.lock:
+			rows = self.db.execute(
+					'SELECT url, competition_key, status, '
+					'submission_id, data, events FROM matches '
+					"WHERE status != 'finished'"
+			).fetchall()
+
+		return [{
+				'url': row[0],
+				'competition_key': row[1],
+				'status': row[2],
+				'submission_id': row[3],
+				'data': json.loads(row[4]),
+				'events': json.loads(row[5])
+		} for row in rows]
+
+	''' Returns the status of the match with the given URL, or None if
+	    we've never seen it. '''
+	def status(self, url):
+
+		with self.lock:
+			row = self.db.execute('SELECT status FROM matches WHERE url = ?',
+					      (url,)).fetchone()
+
+		return row[0] if row else None
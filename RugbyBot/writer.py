@@ -0,0 +1,266 @@
+#
+# Writer: The single outbound queue for every write the bot makes to
+# Reddit -- new threads, and edits to them.
+#
+# Writes are sent one at a time by a background thread, within a budget of
+# writes per period. New threads and final scores go ahead of routine
+# edits, and an edit queued for a thread that already has one waiting
+# replaces it, so only the latest body is ever sent. A failed write is
+# retried with a jittered, exponential backoff.
+#
+# ========================================================================
+
+
+import re
+import time
+import random
+import threading
+import itertools
+
+from metrics import metrics
+
+
+# Lower values are sent first.
+PRIORITY_POST  = 0
+PRIORITY_FINAL = 0
+PRIORITY_EDIT  = 1
+
+
+'''   A queued write. 'fn' is called with 'args' to perform it. '''
+class Write(object):
+
+	''' Create a Write.
+	    Args:
+	    	key: Identifies the write. A later write with the same key
+		     replaces this one while it's queued.
+		match: The Match the write is for.
+		priority: One of the PRIORITY_* values.
+		fn: The callable that performs the write.
+		args: The positional arguments to call it with.
+		seq: The order the write was queued in.
+	'''
+	def __init__(self, key, match, priority, fn, args, seq):
+
+		self.key      = key
+		self.match    = match
+		self.priority = priority
+		self.fn       = fn
+		self.args     = args
+		self.seq      = seq
+
+		self.attempts = 0
+		self.next_try = 0
+
+
+'''   Serializes every write to Reddit through one background thread. '''
+class RedditWriter(object):
+
+	''' Create a RedditWriter.
+	    Args:
+	    	budget: The number of writes we may send per period.
+		period: The length of the budget's period, in seconds.
+		max_attempts: The number of times a write is tried before it's
+			      dropped.
+		backoff: The delay (in seconds) before the first retry. Each
+			 retry after that waits twice as long as the last.
+		max_backoff: The longest we'll wait before a retry.
+	'''
+	def __init__(self, budget, period, max_attempts, backoff, max_backoff):
+
+		self.budget	  = budget
+		self.period	  = period
+		self.max_attempts = max_attempts
+		self.backoff	  = backoff
+		self.max_backoff  = max_backoff
+
+		# The writes waiting to be sent, by key, and the key of the write
+		# being sent right now.
+		self.queue	  = {}
+		self.active	  = None
+		self.seq	  = itertools.count()
+		self.cond	  = threading.Condition()
+		self.thread	  = None
+
+		# The budget is a token bucket holding up to 'budget' writes. When
+		# Reddit tells us to slow down, all writes stop until it says.
+		self.tokens	  = float(budget)
+		self.refilled	  = time.time()
+		self.paused_until = 0
+
+		# Called with the Match after each successful write.
+		self.on_written	  = None
+
+		self.stats = {'sent': 0, 'merged': 0, 'retried': 0, 'dropped': 0}
+
+	''' Queue a write. If a write with the same key is already queued it's
+	    replaced by this one, keeping the higher of the two priorities.
+	    Args:
+	    	key: Identifies the write (e.g. ('edit', url)).
+		match: The Match the write is for.
+		priority: One of the PRIORITY_* values.
+		fn: The callable that performs the write.
+		*args: The positional arguments to call it with.
+	'''
+	def put(self, key, match, priority, fn, *args):
+
+		with self.cond:
+			queued = self.queue.get(key)
+			if queued:
+				priority = min(priority, queued.priority)
+				self.stats['merged'] += 1
+				metrics.inc('rugby_writes_merged_total', kind=key[0])
+
+			self.queue[key] = Write(key, match, priority, fn, args,
+						next(self.seq))
+			self.cond.notify()
+
+			if self.thread is None:
+				self.thread = threading.Thread(target=self._work)
+				self.thread.daemon = True
+				self.thread.start()
+
+	''' Returns True if a write with the given key is queued, or being
+	    sent. '''
+	def is_pending(self, key):
+
+		with self.cond:
+			return key in self.queue or key == self.active
+
+	''' Send writes until the process exits. '''
+	def _work(self):
+
+		while True:
+			write = self._next()
+			try:
+				self._send(write)
+			except Exception as exc:
+				print 'writer error: ', write.key, str(exc)
+				metrics.error('writer', exc)
+			finally:
+				with self.cond:
+					self.active = None
+
+	''' Send a write once, queueing it to be retried if it fails. '''
+	def _send(self, write):
+
+		self._throttle()
+
+		start = time.time()
+		try:
+			write.fn(*write.args)
+		except Exception as exc:
+			metrics.observe('rugby_write_seconds', time.time() - start,
+					kind=write.key[0], result='error')
+			metrics.error('writer', exc)
+			self._retry(write, exc)
+			return
+
+		metrics.observe('rugby_write_seconds', time.time() - start,
+				kind=write.key[0], result='ok')
+		self.stats['sent'] += 1
+
+		# The write has been made, so a failure to record it mustn't send
+		# it again.
+		if self.on_written:
+			try:
+				self.on_written(write.match)
+			except Exception as exc:
+				print 'writer callback error: ', write.key, str(exc)
+				metrics.error('writer', exc)
+
+	''' Block until a write is due, then take it off the queue. Of the due
+	    writes, the highest priority one that was queued first is sent. '''
+	def _next(self):
+
+		with self.cond:
+			while True:
+				now = time.time()
+				due = [w for w in self.queue.values() if w.next_try <= now]
+				if due:
+					break
+
+				wait = None
+				if self.queue:
+					wait = min(w.next_try for w in self.queue.values()) - now
+				self.cond.wait(wait)
+
+			write = min(due, key=lambda w: (w.priority, w.seq))
+			del self.queue[write.key]
+			self.active = write.key
+
+			return write
+
+	''' Wait until the budget allows another write, and take it. '''
+	def _throttle(self):
+
+		while True:
+			now = time.time()
+			if now < self.paused_until:
+				time.sleep(self.paused_until - now)
+				continue
+
+			rate = float(self.budget) / self.period
+			self.tokens = min(self.budget,
+					  self.tokens + (now - self.refilled) * rate)
+			self.refilled = now
+			if self.tokens >= 1:
+				self.tokens -= 1
+				return
+
+			time.sleep((1 - self.tokens) / rate)
+
+	''' Queue a failed write to be tried again, unless it has used up its
+	    attempts or a newer write has replaced it in the meantime. '''
+	def _retry(self, write, exc):
+
+		print 'writer error: ', write.key, str(exc)
+
+		write.attempts += 1
+		if write.attempts >= self.max_attempts:
+			print 'writer dropping ', write.key
+			self.stats['dropped'] += 1
+			metrics.inc('rugby_writes_dropped_total', kind=write.key[0])
+			return
+
+		delay = min(self.max_backoff, self.backoff * 2 ** (write.attempts - 1))
+		delay *= random.uniform(0.5, 1.5)
+
+		# If Reddit has told us how long to wait, everything waits.
+		retry_after = _retry_after(exc)
+		if retry_after is not None:
+			self.paused_until = time.time() + retry_after
+			delay = max(delay, retry_after)
+
+		with self.cond:
+			if write.key not in self.queue:
+				write.next_try = time.time() + delay
+				self.queue[write.key] = write
+				self.stats['retried'] += 1
+				self.cond.notify()
+
+
+''' Returns the number of seconds Reddit asked us to wait before writing
+    again, or None if the error isn't a rate limit.
+    Args:
+	exc: The exception raised by the write.
+'''
+def _retry_after(exc):
+
+	# An HTTP 429, e.g. a prawcore ResponseException.
+	response = getattr(exc, 'response', None)
+	if getattr(response, 'status_code', None) == 429:
+		try:
+			return float(response.headers.get('retry-after'))
+		except (TypeError, ValueError):
+			return 0
+
+	# A praw APIException, e.g. 'you are doing that too much. try again
+	# in 5 minutes.'
+	if getattr(exc, 'error_type', None) == 'RATELIMIT':
+		wait = re.search(r'(\d+) (minute|second)', str(exc))
+		if wait:
+			seconds = int(wait.group(1))
+			return seconds * 60 if wait.group(2) == 'minute' else seconds
+		return 60
+
+	return None
@@ -0,0 +1,124 @@
+#
+# XPaths: Registry of the selectors used to scrape ESPN's pages.
+#
+# ESPN changes its markup every so often. When it does, this is the only
+# file that should need to change -- either swap the path out, or add the
+# new one ahead of the old one as an alternate.
+#
+# ========================================================================
+
+
+from lxml import etree
+
+
+'''   A named selector made up of one or more precompiled XPaths. The paths
+      are tried in order, and the first one to match anything wins. '''
+class Selector(object):
+
+	''' Create a Selector.
+	    Args:
+	    	name: The name of the selector, used in error messages.
+		*paths: The XPath expressions, in order of preference.
+	'''
+	def __init__(self, name, *paths):
+
+		self.name  = name
+		self.paths = [etree.XPath(path) for path in paths]
+
+	''' Returns the matches for the first path that matches, or an empty
+	    list if none of them do.
+	    Args:
+	    	node: The element (or tree) to evaluate the paths against.
+	'''
+	def select(self, node):
+
+		for path in self.paths:
+			result = path(node)
+			if result:
+				return result
+
+		return []
+
+
+SELECTORS = {}
+
+''' Add a selector to the registry, replacing any existing selector with the
+    same name.
+    Args:
+	name: The name of the selector.
+	*paths: The XPath expressions, in order of preference.
+'''
+def register(name, *paths):
+
+	SELECTORS[name] = Selector(name, *paths)
+
+
+''' Returns all elements matched by the named selector.
+    Args:
+	name: The name of the selector.
+	node: The element (or tree) to select from.
+'''
+def select(name, node):
+
+	return SELECTORS[name].select(node)
+
+
+''' Returns the first element matched by the named selector. Raises an
+    IndexError if nothing matches, as indexing into an empty xpath() result
+    would.
+    Args:
+	name: The name of the selector.
+	node: The element (or tree) to select from.
+'''
+def select_one(name, node):
+
+	result = select(name, node)
+	if not result:
+		raise IndexError('no match for selector: ' + name)
+
+	return result[0]
+
+
+# Scoreboard page.
+register('scoreboard.status', '//div[@class="game-status"]')
+register('scoreboard.date', 'span[@class="game-date"]')
+register('scoreboard.time', 'span[@class="game-time"]')
+register('scoreboard.competition', '../../../../../../../../a/h2',
+				    'ancestor::*[a/h2][1]/a/h2')
+register('scoreboard.matches', '//a[@class="competitors"]')
+register('scoreboard.match_competition', 'ancestor::*[a/h2][1]/a/h2')
+register('scoreboard.match_status',
+	 'ancestor::*[.//div[@class="game-status"]][1]//div[@class="game-status"]')
+
+# Match page.
+register('match.competition', '//*[@id="custom-nav"]/header/div[1]')
+register('match.venue', '//div[@class="game-details location-details"]')
+register('match.date_time', '//div[@class="game-date-time"]')
+register('match.home_team', '//*[@id="custom-nav"]/header/div[2]'
+			    '/div[1]/div/div[2]/div/div/a/span[2]')
+register('match.away_team', '//*[@id="custom-nav"]/header/div[2]'
+			    '/div[3]/div/div[3]/div/div/a/span[2]')
+register('match.home_score', '//*[@id="custom-nav"]/header/div[2]'
+			     '/div[1]/div/div[3]/div')
+register('match.away_score', '//*[@id="custom-nav"]/header/div[2]'
+			     '/div[3]/div/div[2]/div')
+register('match.game_time', '//*[@id="custom-nav"]/header/div[2]/div[2]/span[3]')
+register('match.home_starters', '//*[@id="main-container"]/div/div/div[1]/'
+				'article[1]/div/div[1]/div/div/div/table/tbody[1]')
+register('match.home_subs', '//*[@id="main-container"]/div/div/div[1]/'
+			    'article[1]/div/div[1]/div/div/div/table/tbody[2]')
+register('match.away_starters', '//*[@id="main-container"]/div/div/div[1]/'
+				'article[1]/div/div[2]/div/div/div/table/tbody[1]')
+register('match.away_subs', '//*[@id="main-container"]/div/div/div[1]/'
+			    'article[1]/div/div[2]/div/div/div/table/tbody[2]')
+register('match.commentary_link', '//*[@id="main-container"]/div/div/div[2]'
+				  '/article[2]/footer/a',
+				  '//*[@id="main-container"]/div/div/div[2]'
+				  '/article[1]/footer/a')
+
+# Lineup table rows. N.B. -- Sometimes ESPN screws up the lineup formatting.
+register('lineup.number', './/span[@class="number"]', './/td[@class="number"]')
+register('lineup.name', './/span[@class="name"]', './/td[@class="date"]')
+
+# Commentary page.
+register('commentary.table', '//*[@id="tab1"]/table/tbody')